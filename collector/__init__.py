@@ -0,0 +1,8 @@
+# The Collector is only imported when it is used, so scripts answering from
+# the catalogue snapshot don't load the collection classes.
+
+def __getattr__(name):
+    if name == "Collector":
+        from .collector import Collector
+        return Collector
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import threading
+from pathlib import Path
+
+BATCH_SIZE = 256
+INTERVAL = 5
+
+
+class Checkpoint:
+    """Append only journal of the files already hashed by a build, one JSON
+    list per line:
+
+        [relative path, size, mtime_ns, {algorithm: hexdigest}]
+
+    Records are buffered and written and fsynced in batches, every batch_size
+    records or interval seconds. A crash can only lose the last batch, and a
+    truncated last line is ignored when the journal is loaded.
+    """
+
+    def __init__(self, path, batch_size=BATCH_SIZE, interval=INTERVAL):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.file = None
+
+    def load(self):
+        "Returns a dictionary of relative path: (size, mtime_ns, digests)"
+        entries = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        path, size, mtime_ns, digests = json.loads(line)
+                    except ValueError:
+                        # Line cut by a crash
+                        continue
+                    entries[path] = (size, mtime_ns, digests)
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def truncate_partial_line(self):
+        "Drops the end of a line cut by a crash so new records start clean"
+        try:
+            f = open(self.path, "rb+")
+        except FileNotFoundError:
+            return
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - 4096)
+                f.seek(start)
+                chunk = f.read(position - start)
+                newline = chunk.rfind(b"\n")
+                if newline != -1:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position != end:
+                f.truncate(position)
+
+    def open(self, resume=False):
+        "Opens the journal for writing, it is emptied unless resuming"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if resume:
+            self.truncate_partial_line()
+        self.file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        return self
+
+    def record(self, relative_path, size, mtime_ns, digests):
+        with self.lock:
+            self.buffer.append(json.dumps([relative_path, size, mtime_ns, digests]))
+            if (len(self.buffer) >= self.batch_size or
+                    time.monotonic() - self.last_flush >= self.interval):
+                self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            self.file.write("\n".join(self.buffer) + "\n")
+            self.buffer = []
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        "The build finished, the journal isn't needed anymore"
+        self.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -1,3 +1,18 @@
+from pathlib import Path
+from .command import EXCLUDED_FILES
+from .file import File, DirectoryItemFile
+from .item import Item, FileItem, DirectoryItem
+from .digest import DEFAULT_ALGORITHM
+
+
+def reconcile(old_index, new_index):
+    """Compares two dictionaries of key: element (items or files) in linear
+    time, returns the (added, removed, common) lists of elements. common holds
+    the elements of new_index."""
+    added = [element for key, element in new_index.items() if key not in old_index]
+    removed = [element for key, element in old_index.items() if key not in new_index]
+    common = [element for key, element in new_index.items() if key in old_index]
+    return added, removed, common
 
 
 class Collection:
@@ -14,9 +29,16 @@ class Collection:
     item_class = Item
     file_class = File # You can personalize this object build_from_path to build
                       # sophiticated objects
+    digest_algorithms = (DEFAULT_ALGORITHM,) # All of them are computed in a
+                                             # single read of each file
+    settings = None # CollectionSettings given by the Collector
+    constructor_class = None # Builds it from the filesystem, by default a
+                             # FileSystemCollectionConstructor
 
     class Builder:
-        def __init__(self):
+        def __init__(self, collection_class=None):
+            # The class built, Collection subclasses share this builder
+            self.collection_class = collection_class or Collection
             self.collector = None
             self.items = []
 
@@ -27,25 +49,40 @@ class Collection:
             self.items.append(item)
 
         def build(self):
-            return Collection(self.items, self.collector)
+            return self.collection_class(self.items, self.collector)
 
     # class initialization from filesystem classmethods
 
     @classmethod
     def get_item_name_from_item_path(cls, item_path):
-        raise NotImplemented
+        return item_path.name
+
+    @classmethod
+    def is_hidden(cls, path):
+        return path.name.startswith(".") or path.name in EXCLUDED_FILES
 
     @classmethod
     def collections_item_path_iterator(cls, collection_path):
-        raise NotImplemented
+        "Yields the paths of the items in name order, hidden ones are skipped"
+        directories = cls.item_class.is_directory()
+        for path in sorted(Path(collection_path).iterdir()):
+            if cls.is_hidden(path) or path.is_dir() != directories:
+                continue
+            yield path
 
     @classmethod
     def items_file_path_iterator(cls, item_path):
-        raise NotImpolemented
+        "Yields the paths of the files of a directory item in name order"
+        for path in sorted(Path(item_path).rglob("*")):
+            relative_path = path.relative_to(item_path)
+            if any(part.startswith(".") for part in relative_path.parts):
+                continue
+            if path.is_file():
+                yield path
 
     @classmethod
-    def get_file_builder_from_relative_path(cls, file_relative_path)
-        raise NotImplemented
+    def get_file_builder_from_relative_path(cls, file_relative_path):
+        return cls.file_class.Builder(cls.file_class)
 
     def __init__(self, items, collector):
         self.items = items
@@ -63,10 +100,31 @@ class Collection:
         for item in self.items:
             for file in item.iter_files():
                 yield file
-        
-       def update_sha1(self):
+
+    def index_items(self):
+        "Returns a dictionary of item key: item"
+        return {item.key: item for item in self.items}
+
+    def index_files(self):
+        "Returns a dictionary of file key: file, keys include the item path"
+        return {file.key: file for file in self.iter_files()}
+
+    def reconcile_items(self, other):
+        "Returns the (added, removed, common) items of other against self"
+        return reconcile(self.index_items(), other.index_items())
+
+    def reconcile_files(self, other):
+        "Returns the (added, removed, common) files of other against self"
+        return reconcile(self.index_files(), other.index_files())
+
+    def update_sha1(self):
         pass
 
+    def update_digests(self):
+        "Computes the digests of the items from the ones of their files"
+        for item in self.items:
+            item.update_digests(self.digest_algorithms)
+
     def validate_file(self, path):
         "Check if a file conforms the collection, in negative case it is ignored"
         return True
@@ -86,5 +144,6 @@ class FileCollection(Collection):
 class DirectoryCollection(Collection):
     "A colection made of directories"
     item_class = DirectoryItem
+    file_class = DirectoryItemFile
 
 
@@ -1,67 +1,146 @@
-from ..jmcollector import *
+from pathlib import Path
+from ..file import File
+from ..item import FileItem
+from ..collection import FileCollection
+from ..constructor import FileSystemCollectionConstructor, DatabaseCollectionConstructor
+from ..perceptual import (compute_thumbnail_and_dhash, find_clusters,
+                          get_thumbnail_path, DEFAULT_THRESHOLD)
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp"}
+
+
 class ImageFile(File):
-    async def awaitable_stuff(self, pool):
-        await super().awaitable_stuff(pool)
-        await self.compute_thumnail(pool)
+    phash = None
+
+    def set_phash(self, phash):
+        self.phash = phash
+        if getattr(self, "item", None) is not None:
+            self.item.phash = phash
+
+    def compute_thumbnail(self, pool, thumbnail_path):
+        "Writes the thumbnail and computes the dhash decoding the image once"
+        thumbnail_path.parent.mkdir(parents=True, exist_ok=True)
+        return pool.apply_async(compute_thumbnail_and_dhash,
+                                [self.path, thumbnail_path],
+                                callback=self.set_phash)
 
-    async def compute_thumbnail(self, pool):
-        await pool.apply(compute_thumnail, [self.relative_path, self.thumbnail_path, 
 
 class ImageItem(FileItem):
     """Image item consists of two files the main image file and the thumbnail
     one, the managemenent is simplified as both share the same relative_path
     """
 
-    class Builder(Item.Builder):
+    class Builder(FileItem.Builder):
         def __init__(self):
             super().__init__()
-            self.thumbnail_sha1=""
+            self.thumbnail_sha1 = ""
+            self.phash = None
 
         def set_thumbnail_sha1(self, sha1):
-            self.thumbnail_sha1=sha1
+            self.thumbnail_sha1 = sha1
+            return self
+
+        def set_phash(self, phash):
+            self.phash = phash
+            return self
 
         def build(self):
-            return ImageItem(self.name,
-                        self.collection,
-                        self.relative_path,
-                        self.size,
-                        value=self.value,
-                        sha1=self.sha1,
-                        thumbnail_sha1=self.thumbnail_sha1,
-                        volumes=self.volumes)
-    
-    def __init__(self, name, collection, relative_path, size, value=5, 
-                 sha1="", thumbnail_sha1="", volumes=[]):
-        super().__init__(name, collection, relative_path, size, value=value, 
-                         sha1=sha1, volumes=volumes)
-        self.thumbnail_sha1=thumbnail_sha1()
+            return ImageItem(self.file,
+                             self.name,
+                             self.collection,
+                             self.path,
+                             self.relative_path,
+                             self.size,
+                             value=self.value,
+                             sha1=self.sha1,
+                             thumbnail_sha1=self.thumbnail_sha1,
+                             phash=self.phash,
+                             volumes=self.volumes)
+
+    def __init__(self, file, name, collection, path, relative_path, size, value=5,
+                 sha1="", thumbnail_sha1="", phash=None, volumes=[]):
+        super().__init__(file, name, collection, path, relative_path, size,
+                         value=value, sha1=sha1, volumes=volumes)
+        self.thumbnail_sha1 = thumbnail_sha1
+        # Perceptual hash, close values mean similar images
+        self.phash = phash
+
+    def get_extras(self):
+        return {"phash": self.phash} if self.phash is not None else {}
 
 
 class ImageCollection(FileCollection):
-    file_class = "ImageFile"
+    item_class = ImageItem
+    file_class = ImageFile
     thumbnail_path = ".thumbnails"
 
-
-class ImageCollectionFileSystemInitializer(FileSystemInitializer):
+    @classmethod
+    def collections_item_path_iterator(cls, collection_path):
+        "Only the image files are items"
+        for path in super().collections_item_path_iterator(collection_path):
+            if path.suffix.lower() in IMAGE_SUFFIXES:
+                yield path
+
+    def get_thumbnail_path(self, item):
+        return get_thumbnail_path(Path(self.path, self.thumbnail_path),
+                                  item.relative_path)
+
+    def load_known_phashes(self):
+        """Perceptual hashes in the catalogue, by (relative path, digest) with
+        the first digest algorithm of the collection"""
+        from ..snapshot import Snapshot, RELATIVE_PATH, EXTRA, DIGESTS
+        snapshot = Snapshot.load(self.collector.path)
+        if snapshot is None:
+            return {}
+        algorithm = self.digest_algorithms[0]
+        return {(record[RELATIVE_PATH], record[DIGESTS].get(algorithm)):
+                record[EXTRA]["phash"]
+                for _, record in snapshot.iter_items(str(self.relative_path))
+                if "phash" in record[EXTRA]}
+
+    def iter_pending_thumbnails(self):
+        """Yields the items whose image changed or lacks a thumbnail, the
+        others get their perceptual hash back from the catalogue"""
+        known = self.load_known_phashes()
+        for item in self.iter_items():
+            digest = item.get_digest(item.digest_algorithms[0])
+            phash = known.get((str(item.relative_path), digest))
+            if phash is not None and self.get_thumbnail_path(item).exists():
+                item.file.set_phash(phash)
+                continue
+            yield item
+
+    def find_near_duplicates(self, threshold=DEFAULT_THRESHOLD):
+        "Returns lists of items whose images look the same"
+        items = {n: item for n, item in enumerate(self.items)
+                 if item.phash is not None}
+        hashes = {n: item.phash for n, item in items.items()}
+        return [[items[n] for n in cluster]
+                for cluster in find_clusters(hashes, threshold)]
+
+
+class ImageCollectionFileSystemInitializer(FileSystemCollectionConstructor):
     collection_class = ImageCollection
 
-    def prebuild_stuff(self, collection_builder):
-        item_class = self.collection_class.item_class
-        for path in self.path.iterdir():
-            item_builder = item_class.Builder()
-            item_builder.set_name(path.name())
-            item_builder.set_pat(path)
-            item_builder.set_size(path.stat().size)
-            item = item_builder.build()
-            collection_builder.add_item(item)
+    def compute_hashes(self, collection):
+        super().compute_hashes(collection)
+        self.compute_thumbnails(collection)
+
+    def compute_thumbnails(self, collection):
+        "Only images that changed or lack a thumbnail are decoded again"
+        pool = self.collector.get_pool(self.workers)
+        results = [item.file.compute_thumbnail(
+                       pool, collection.get_thumbnail_path(item))
+                   for item in collection.iter_pending_thumbnails()]
+        for result in results:
+            result.get()
 
-    def postbuild_sturff(self, collection):
-        for item in collection.items:
-            item.set_collection(collection)
 
+# Image collections in the settings are built with their thumbnails
+ImageCollection.constructor_class = ImageCollectionFileSystemInitializer
 
 
-class ImageCollectionDatabaseConstructor(DatabaseConstructor):
+class ImageCollectionDatabaseConstructor(DatabaseCollectionConstructor):
     collection_class = ImageCollection
     items_table = None
 
@@ -72,7 +151,7 @@ class ImageCollectionDatabaseConstructor(DatabaseConstructor):
         pass
 
         
-class ImageCollectionJsonDump(DatabaseConstructor):
+class ImageCollectionJsonDump(DatabaseCollectionConstructor):
     collection_class = ImageCollection
     items_table = None
 
@@ -1,3 +1,7 @@
+from pathlib import Path
+from .command import COLLECTION_SETTINGS
+from .registry import registry, CollectionSettings
+
 
 class Collector:
     """The root of the collection system, an object that represents the main 
@@ -12,23 +16,105 @@ class Collector:
      * loaded
      * syncronized
      * not-syncronized
-    """
 
-    collections = []
+    Collections are defined in the settings file, their classes are only
+    imported when they are used.
+    """
 
     def __init__(self, path):
         self.path = path
+        self.collections = []
+        self.pools = {}
+        self._settings = None
+        self.collection_classes = {}
+
+    @property
+    def settings(self):
+        "The content of the settings file, loaded the first time it is used"
+        if self._settings is None:
+            from .command import load
+            try:
+                with open(Path(self.path, COLLECTION_SETTINGS), encoding="utf-8") as f:
+                    self._settings = load(f) or {}
+            except FileNotFoundError:
+                self._settings = {}
+            for name, target in self._settings.get("types", {}).items():
+                registry.register(name, target)
+        return self._settings
+
+    def iter_collection_names(self):
+        return iter(self.settings.get("collections", {}))
+
+    def get_collection_settings(self, name):
+        try:
+            data = self.settings.get("collections", {})[name]
+        except KeyError:
+            raise ValueError(f"There is no collection '{name}' in the settings")
+        return CollectionSettings(name, data)
+
+    def get_collection_class(self, name):
+        """Returns the class of the collection, a subclass of the registered
+        type configured with the collection settings"""
+        if name not in self.collection_classes:
+            settings = self.get_collection_settings(name)
+            base = registry.get(settings.type)
+            attributes = {"relative_path": settings.path,
+                          "digest_algorithms": tuple(settings.digest),
+                          "settings": settings,
+                          "__module__": base.__module__}
+            self.collection_classes[name] = type(base.__name__, (base,), attributes)
+        return self.collection_classes[name]
+
+    def get_pool(self, processes=None):
+        "Returns a worker pool, pools are kept alive between builds"
+        if processes not in self.pools:
+            from multiprocessing import Pool, cpu_count
+            self.pools[processes] = Pool(processes or cpu_count())
+        return self.pools[processes]
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+            pool.join()
+        self.pools = {}
+
+    def build(self, governor=None, resume=True, distributed=None):
+        """Constructs the collections of the settings file from the
+        filesystem, replacing the ones already loaded. governor, an
+        IOGovernor, limits the reads of all the collections, otherwise the
+        throttle of each collection settings is used. The digests
+        checkpointed by an interrupted build are reused unless resume is
+        False. distributed, the (workers, address) of parse_distributed,
+        spreads the hashing of all the collections among workers, otherwise
+        the distributed setting of each collection is used."""
+        from .constructor import (FileSystemCollectionConstructor,
+                                  DistributedCollectionConstructor)
+        collections = []
+        for name in self.iter_collection_names():
+            collection_class = self.get_collection_class(name)
+            settings = collection_class.settings
+            collection_governor = governor or settings.get_governor()
+            collection_distributed = distributed or settings.get_distributed()
+            if collection_distributed is not None:
+                workers, address = collection_distributed
+                constructor = DistributedCollectionConstructor(
+                    self, collection_class, workers=workers, address=address,
+                    governor=collection_governor)
+            else:
+                constructor_class = (collection_class.constructor_class or
+                                     FileSystemCollectionConstructor)
+                constructor = constructor_class(self, collection_class,
+                                                governor=collection_governor)
+            collections.append(constructor.construct(resume=resume))
+        self.collections = collections
+        return collections
 
     def iter_items(self):
         for collection in self.collections:
-            for item in collection.iter_items(self):
+            for item in collection.iter_items():
                 yield item
 
     def add_collection(self, collection):
         self.collections.append(collection)
 
 
-
-
-
-
@@ -1,16 +1,8 @@
 import sys
 import os
-from multiprocessing import 
 from pathlib import Path
 import logging
-import argparse
-import platform
-import json
-from yaml import load, dump
-try:
-    from yaml import CLoader as YLoader, CDumper as YDumper
-except ImportError:
-    from yaml import Loader as YLoader, Dumper as YDumper
+from functools import lru_cache
 
 # Logging stuff
 
@@ -22,6 +14,32 @@ formatter = logging.Formatter("%(levelname)s - %(message)s")
 ch.setFormatter(formatter)
 logger.addHandler(ch)
 
+# Lazy loading stuff
+#
+# Heavy modules (multiprocessing, yaml, json, argparse, platform) are only
+# imported when a command really needs them, so quick queries like `list`
+# don't pay for them at startup.
+
+@lru_cache(maxsize=None)
+def get_yaml():
+    "Returns the yaml module and the fastest loader and dumper available"
+    import yaml
+    try:
+        from yaml import CLoader as YLoader, CDumper as YDumper
+    except ImportError:
+        from yaml import Loader as YLoader, Dumper as YDumper
+    return yaml, YLoader, YDumper
+
+
+def load(stream):
+    yaml, YLoader, _ = get_yaml()
+    return yaml.load(stream, Loader=YLoader)
+
+
+def dump(data, stream=None):
+    yaml, _, YDumper = get_yaml()
+    return yaml.dump(data, stream, Dumper=YDumper)
+
 # Platform stuff
 # Constants
 
@@ -29,6 +47,10 @@ DIRECTORY_STRUCTURE = {}
 VOLUME_MAX_SIZE = 4300 * 1024 * 1024
 TAG = ".jmtag"
 INFO_PATH = ".jminfo/data.yml"
+SNAPSHOT_PATH = ".jminfo/catalogue.snapshot"
+CHECKPOINT_PATH = ".jminfo/checkpoints"
+SORT_MEMORY_LIMIT = 64 * 1024 * 1024
 EXCLUDED_FILES = [TAG]
 MASTER_PATH="~/Dropbox"
 COLLECTION_SETTINGS="jmcollector.yml"
+DAEMON_IDLE_TIMEOUT = 10 * 60
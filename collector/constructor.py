@@ -1,6 +1,7 @@
+import os
 from pathlib import Path
-import asyncio
-from multiprocessing import Pool, cpu_count 
+from .command import CHECKPOINT_PATH
+from .checkpoint import Checkpoint
 
 DEFAULT_VALUE = 5
 
@@ -15,6 +16,8 @@ class CollectionConstructor:
         self.collection_path = Path(self.collector.path, self.relative_path)
         self.item_class = self.collection_class.item_class
         self.file_class = self.collection_class.file_class
+        self.settings = self.collection_class.settings
+        self.resume = True
 
     def prebuild_stuff(self, builder):
         "Here loads the items to the class"
@@ -24,15 +27,18 @@ class CollectionConstructor:
         "Here processes the items and integrates them into the collection" 
         pass
 
-    def construct(self, relative_path):
+    def construct(self, relative_path=None, resume=True):
+        # Resuming reuses the work checkpointed by an interrupted build, the
+        # files that changed since then are hashed again
+        self.resume = resume
         # Instantiates the Collection class builder
-        builder = self.collection_class.Builder()
+        builder = self.collection_class.Builder(self.collection_class)
         # Sets the collector for the collection
         builder.set_collector(self.collector)
         # Invoques subclasses building stuff
         self.prebuild_stuff(builder)
 
-        collection = builder.Build()
+        collection = builder.build()
 
         # Let subclasses run some of their postbuild stuff
         self.postbuild_stuff(collection)
@@ -41,6 +47,11 @@ class CollectionConstructor:
 
 class FileSystemCollectionConstructor(CollectionConstructor):
 
+    def __init__(self, collector, collection_class, governor=None):
+        super().__init__(collector, collection_class)
+        # An IOGovernor limiting the reads of the build
+        self.governor = governor
+
     def get_item_name_from_path(self, item_path):
         return self.collection_class.get_item_name_from_item_path(item_path)
 
@@ -66,6 +77,7 @@ class FileSystemCollectionConstructor(CollectionConstructor):
             ibuilder.set_relative_path(item_path.relative_to(self.collection_path))
             # Checks for one of the two kinds of dirs
             if self.item_class.is_directory():
+                size = 0
                 # Request collection for an iterator of files
                 for file_path in self.collection_file_path_iterator(item_path):
                     file_relative_path = file_path.relative_to(item_path)
@@ -74,17 +86,22 @@ class FileSystemCollectionConstructor(CollectionConstructor):
                     # Set minimum parapeters for file before building
                     fbuilder.set_path(file_path)
                     fbuilder.set_relative_path(file_relative_path)
+                    fbuilder.set_size(file_path.stat().st_size)
                     # Builds the file
                     f = fbuilder.build()
+                    size += f.size
                     # Adds the file to the item bulder
                     ibuilder.add_file(f)
+                ibuilder.set_size(size)
             else:
                 # In case thats is a single file collection
-                fbuilder = self.collection_class.file_class.Build()
-                fbuilder.set_path(file_path)
+                fbuilder = self.get_file_builder_from_relative_path(Path("."))
+                fbuilder.set_path(item_path)
+                fbuilder.set_size(item_path.stat().st_size)
                 # Buildes the file
                 f = fbuilder.build()
                 ibuilder.set_file(f)
+                ibuilder.set_size(f.size)
             # Builds item
             item = ibuilder.build()
             collection_builder.add_item(item)
@@ -97,15 +114,132 @@ class FileSystemCollectionConstructor(CollectionConstructor):
             for file in item.iter_files():
                 file.set_item(item)
         # Launch heavy computational stuff.
-        pool = Pool(cpu_count())
-        asyncio.run(self.postbuild_async_stuff(collection, pool))
-        pool.join()
+        self.compute_hashes(collection)
+        collection.update_digests()
+
+    @property
+    def workers(self):
+        return self.settings.workers if self.settings is not None else None
 
-    async def postbuild_async_stuff(self, collection, pool):
+    def get_checkpoint(self):
+        name = str(self.relative_path).replace(os.sep, "_") + ".jsonl"
+        return Checkpoint(Path(self.collector.path, CHECKPOINT_PATH, name))
+
+    def iter_pending_files(self, collection, checkpoint):
+        """Yields (file, callback) for the files that still need hashing, the
+        ones checkpointed and unchanged since then get their digests back"""
+        done = checkpoint.load() if self.resume else {}
         for file in collection.iter_files():
-            await file.awaitable_stuff(pool)
-        for item in collection.iter_items():
-            await item.awaitable_stuff(pool)
+            relative_path = str(Path(file.path).relative_to(self.collection_path))
+            st = os.stat(file.path)
+            entry = done.get(relative_path)
+            if entry is not None:
+                size, mtime_ns, digests = entry
+                if (size == st.st_size and mtime_ns == st.st_mtime_ns and
+                        all(a in digests for a in file.digest_algorithms)):
+                    file.set_digests(digests)
+                    continue
+            yield file, self.checkpointed(file, relative_path, st, checkpoint)
+
+    def checkpointed(self, file, relative_path, st, checkpoint):
+        def callback(digests):
+            file.set_digests(digests)
+            checkpoint.record(relative_path, st.st_size, st.st_mtime_ns, digests)
+        return callback
+
+    def compute_hashes(self, collection):
+        checkpoint = self.get_checkpoint()
+        # Loads what is done before open() empties it in a new build
+        pending = list(self.iter_pending_files(collection, checkpoint))
+        checkpoint.open(resume=self.resume)
+        try:
+            self.compute_pending_hashes(collection, pending)
+        finally:
+            checkpoint.close()
+        checkpoint.remove()
+
+    def compute_pending_hashes(self, collection, pending):
+        "Hashes the (file, callback) pairs, callbacks take the digests"
+        if self.governor is not None:
+            self.compute_governed_hashes(pending)
+        else:
+            # The pool belongs to the collector so it can be reused by the
+            # next build.
+            pool = self.collector.get_pool(self.workers)
+            results = [file.compute_hash(pool, callback=callback)
+                       for file, callback in pending]
+            for result in results:
+                result.get()
+
+    def compute_governed_hashes(self, pending):
+        # Throttled workers need their own pool
+        from .throttle import governed_digests_file
+        self.governor.start()
+        pool = self.governor.make_pool(self.workers)
+        try:
+            results = [pool.apply_async(governed_digests_file,
+                                        [file.path, file.digest_algorithms],
+                                        callback=callback)
+                       for file, callback in pending]
+            for result in results:
+                result.get()
+        finally:
+            pool.close()
+            pool.join()
+            self.governor.stop()
+
+
+class DistributedCollectionConstructor(FileSystemCollectionConstructor):
+    """Builds the collection from the filesystem spreading the hashing among
+    workers in several hosts that mount the master. Without an address the
+    workers are local processes."""
+
+    def __init__(self, collector, collection_class, workers=None, address=None,
+                 governor=None):
+        # Workers read on their own hosts, an IOGovernor can't reach them
+        if governor is not None:
+            raise ValueError("Distributed builds can't be throttled, limit "
+                             "the IO of the worker hosts instead")
+        super().__init__(collector, collection_class)
+        self.local_workers = workers
+        self.address = address
+
+    def run(self, coordinator):
+        if self.address is None:
+            failed = coordinator.run_local(self.local_workers or self.workers)
+        else:
+            failed = coordinator.serve(*self.address)
+        if failed:
+            raise RuntimeError(f"{len(failed)} chunks of the {coordinator.task} "
+                               f"task failed")
+
+    @property
+    def chunk_size(self):
+        from .distributed import CHUNK_SIZE
+        return self.settings.chunk_size if self.settings else CHUNK_SIZE
+
+    def compute_hashes(self, collection):
+        # The digests go through the checkpoint like in a local build
+        super().compute_hashes(collection)
+        # Image collections get the thumbnails and perceptual hashes of the
+        # images that changed or lack them
+        iter_pending_thumbnails = getattr(collection, "iter_pending_thumbnails",
+                                          None)
+        if iter_pending_thumbnails is None:
+            return
+        files = [item.file for item in iter_pending_thumbnails()]
+        if files:
+            from .distributed import Coordinator
+            self.run(Coordinator(collection, task="thumbnail",
+                                 args={"thumbnail_path": collection.thumbnail_path},
+                                 files=files, chunk_size=self.chunk_size))
+
+    def compute_pending_hashes(self, collection, pending):
+        from .distributed import Coordinator
+        callbacks = {str(Path(file.path).relative_to(collection.path)): callback
+                     for file, callback in pending}
+        self.run(Coordinator(collection, files=[file for file, _ in pending],
+                             callbacks=callbacks, chunk_size=self.chunk_size))
 
 
 class JsonCollectionConstructor(CollectionConstructor):
@@ -1,27 +1,32 @@
 import sys
 import hashlib
-import platform
+from functools import lru_cache
 from subprocess import run, PIPE
 
 
-raw_platform = platform.platform()
+@lru_cache(maxsize=None)
+def get_platform():
+    "Returns the platform name, computed only the first time it is asked for"
+    import platform
+    raw_platform = platform.platform()
 
-if raw_platform[0:5] == "macOS":
-    PLATFORM = "MACOS"
-elif raw_platform[0:5] == "Linux":
-    PLATFORM = "LINUX"
-elif raw_platform[0:7] == "WINDOWS":
-    PLATFORM = "WINDOWS"
-else:
-    print("System Unknown")
-    sys.exit(1)
+    if raw_platform[0:5] == "macOS":
+        return "MACOS"
+    elif raw_platform[0:5] == "Linux":
+        return "LINUX"
+    elif raw_platform[0:7] == "WINDOWS":
+        return "WINDOWS"
+    else:
+        print("System Unknown")
+        sys.exit(1)
 
 
 def get_sha1_file(path):
-    if PLATFORM in ["LINUX","MACOS"]:
-        if PLATFORM == "LINUX":
+    platform = get_platform()
+    if platform in ["LINUX","MACOS"]:
+        if platform == "LINUX":
             p = run(["/usr/bin/shasum", path], stdout=PIPE, stderr=PIPE)
-        elif PLATFORM == "MACOS":
+        elif platform == "MACOS":
             p = run(["/usr/bin/shasum", "-a", "1", path], stdout=PIPE, stderr=PIPE)
         if p.returncode:
             print("Error processing file %s." % path)
@@ -30,7 +35,7 @@ def get_sha1_file(path):
     else:
         BUF_SIZE = 65536  # lets read stuff in 64kb chunks!
         sha1 = hashlib.sha1()
-        with open(sys.argv[1], 'rb') as f:
+        with open(path, 'rb') as f:
             while True:
                 data = f.read(BUF_SIZE)
                 if not data:
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import socket
+import tempfile
+import threading
+from .command import logger, DAEMON_IDLE_TIMEOUT
+from .snapshot import Snapshot
+
+
+def get_socket_path():
+    "Returns the path of the daemon socket for the current user"
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir())
+    return os.path.join(runtime_dir, f"jmcollector-{os.getuid()}.sock")
+
+
+class ReadWriteLock:
+    "Lets many readers in at the same time but writers one by one and alone"
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.write_lock = threading.Lock()
+
+    def acquire_read(self):
+        with self.condition:
+            while self.writer:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        # Writes are applied in sequence, so the next writer waits here
+        self.write_lock.acquire()
+        with self.condition:
+            self.writer = True
+            while self.readers:
+                self.condition.wait()
+
+    def release_write(self):
+        with self.condition:
+            self.writer = False
+            self.condition.notify_all()
+        self.write_lock.release()
+
+
+class CatalogueDaemon:
+    """A long lived process that keeps a Collector, its collections and its
+    worker pool warm so repeated invocations of the scripts don't have to
+    build them from scratch.
+
+    Clients talk to it through a Unix socket sending one JSON object per line
+    with the form {"command": name, "args": {...}} and receiving one JSON
+    object per line back, {"ok": true, "result": ...} or {"ok": false,
+    "error": message}.
+
+    Read commands are served concurrently, write commands are applied in
+    sequence and exclusively. The daemon shuts down by itself after
+    idle_timeout seconds without requests.
+
+    It starts from the catalogue snapshot on disk, the collections are only
+    built from the filesystem when there is none or on reload. When the
+    snapshot on disk is replaced, by an update for instance, it is loaded
+    again before the next read command.
+    """
+
+    def __init__(self, collector_factory, collector_path, socket_path=None,
+                 idle_timeout=DAEMON_IDLE_TIMEOUT):
+        self.collector_factory = collector_factory
+        self.collector_path = collector_path
+        self.socket_path = socket_path or get_socket_path()
+        self.idle_timeout = idle_timeout
+        self.lock = ReadWriteLock()
+        self.last_activity = time.monotonic()
+        self.collector = None
+        self.snapshot = None
+        # Modification time of the snapshot file the catalogue comes from
+        self.snapshot_mtime = None
+        self.server = None
+        # name: (method, is a write command)
+        self.commands = {
+            "ping": (self.ping, False),
+            "list": (self.list, False),
+            "verify": (self.verify, False),
+            "reload": (self.reload, True),
+            "save": (self.save, True),
+            "shutdown": (self.shutdown, False),
+        }
+
+    # Commands
+
+    def ping(self):
+        return "pong"
+
+    def list(self, collection=None):
+        return [f"{name}/{record[1]}"
+                for name, record in self.snapshot.iter_items(collection)]
+
+    def verify(self, collection=None):
+        return list(self.snapshot.verify(self.collector_path, collection))
+
+    def reload(self):
+        """Rebuilds the collections keeping the worker pool. An empty result
+        doesn't replace a snapshot with collections."""
+        collector = self.collector_factory(self.collector_path)
+        if self.collector is not None:
+            collector.pools = self.collector.pools
+        self.collector = collector
+        collector.build()
+        snapshot = Snapshot.from_collector(collector)
+        if (not snapshot.collections and self.snapshot is not None and
+                self.snapshot.collections):
+            raise ValueError("No collections were built, keeping the "
+                             "current catalogue")
+        self.snapshot = snapshot
+        return len(collector.collections)
+
+    def save(self):
+        self.snapshot.save(self.collector_path)
+        self.snapshot_mtime = self.get_snapshot_mtime()
+        return str(Snapshot.get_path(self.collector_path))
+
+    def shutdown(self):
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+        return "bye"
+
+    # Request handling
+
+    def get_snapshot_mtime(self):
+        try:
+            return os.stat(Snapshot.get_path(self.collector_path)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def refresh(self):
+        "Loads the snapshot on disk if it changed since it was last loaded"
+        mtime = self.get_snapshot_mtime()
+        if mtime is None or mtime == self.snapshot_mtime:
+            return
+        self.lock.acquire_write()
+        try:
+            if mtime != self.snapshot_mtime:
+                snapshot = Snapshot.load(self.collector_path)
+                if snapshot is not None:
+                    logger.info("Loading the new catalogue snapshot")
+                    self.snapshot = snapshot
+                self.snapshot_mtime = mtime
+        finally:
+            self.lock.release_write()
+
+    def handle(self, request):
+        self.last_activity = time.monotonic()
+        try:
+            method, write = self.commands[request["command"]]
+        except KeyError:
+            return {"ok": False, "error": f"Unknown command {request.get('command')}"}
+        args = request.get("args") or {}
+        if not write:
+            self.refresh()
+        acquire, release = ((self.lock.acquire_write, self.lock.release_write)
+                            if write else
+                            (self.lock.acquire_read, self.lock.release_read))
+        acquire()
+        try:
+            return {"ok": True, "result": method(**args)}
+        except Exception as e:
+            logger.exception("Error serving %s", request["command"])
+            return {"ok": False, "error": str(e)}
+        finally:
+            release()
+            self.last_activity = time.monotonic()
+
+    def watch_idle(self):
+        while True:
+            time.sleep(min(self.idle_timeout, 5))
+            busy = self.lock.readers or self.lock.writer
+            if not busy and time.monotonic() - self.last_activity > self.idle_timeout:
+                logger.info("Daemon idle for %s seconds, shutting down",
+                            self.idle_timeout)
+                self.server.shutdown()
+                return
+
+    def serve_forever(self):
+        import socketserver
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                    except ValueError:
+                        response = {"ok": False, "error": "Bad request"}
+                    else:
+                        response = daemon.handle(request)
+                    self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+
+        class Server(socketserver.ThreadingUnixStreamServer):
+            daemon_threads = True
+
+        self.snapshot_mtime = self.get_snapshot_mtime()
+        self.snapshot = Snapshot.load(self.collector_path)
+        if self.snapshot is None:
+            self.reload()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.server = Server(self.socket_path, Handler)
+        os.chmod(self.socket_path, 0o600)
+        threading.Thread(target=self.watch_idle, daemon=True).start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            os.unlink(self.socket_path)
+            if self.collector is not None:
+                self.collector.close()
+
+
+class DaemonClient:
+    "Sends commands to a running CatalogueDaemon"
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile("rb")
+
+    @classmethod
+    def connect(cls, socket_path=None):
+        "Returns a client or None if there is no daemon listening"
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path or get_socket_path())
+        except OSError:
+            sock.close()
+            return None
+        return cls(sock)
+
+    def request(self, command, **args):
+        message = json.dumps({"command": command, "args": args})
+        self.sock.sendall(message.encode("utf-8") + b"\n")
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("The daemon closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
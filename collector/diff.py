@@ -0,0 +1,282 @@
+"""Streaming comparison of two catalogues.
+
+Sources are iterators of (relative_path, size, digest) records sorted by
+path_key(relative_path), digest being the raw bytes of the hash or None when
+it is unknown. diff() walks two of them at once in a single pass, then
+merges the records left unmatched by digest to find the moved files.
+
+Sources that don't come sorted are sorted with external_sort, so memory is
+bounded by memory_limit whatever the size of the catalogue, but catalogue
+snapshots, that are loaded as a whole. diff() raises a ValueError when a
+source turns out not to be sorted.
+"""
+import os
+import json
+from pathlib import Path
+from itertools import groupby
+from .command import SORT_MEMORY_LIMIT, logger
+from .digest import DEFAULT_ALGORITHM, get_digests_file, digest_bytes
+from .extsort import external_sort, Spool
+
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+MOVED = "moved"
+
+# Manifest entries parsed at once
+MANIFEST_BATCH_SIZE = 256
+
+
+def path_key(relative_path):
+    """The order of the sources, path components compared one by one. It is
+    the string order with the separator as the lowest character."""
+    return relative_path.replace("/", "\0")
+
+
+class Change:
+    __slots__ = ("kind", "old", "new")
+
+    def __init__(self, kind, old, new):
+        self.kind = kind
+        self.old = old      # Record in the first source or None
+        self.new = new      # Record in the second source or None
+
+    @property
+    def path(self):
+        return (self.new or self.old)[0]
+
+    def __eq__(self, other):
+        return (self.kind, self.old, self.new) == (other.kind, other.old, other.new)
+
+    def __repr__(self):
+        if self.kind == MOVED:
+            return f"<Change moved '{self.old[0]}' -> '{self.new[0]}'>"
+        return f"<Change {self.kind} '{self.path}'>"
+
+
+def record_key(record):
+    return path_key(record[0])
+
+
+def sorted_source(records, memory_limit=SORT_MEMORY_LIMIT):
+    "Sorts records of any source in path order"
+    return external_sort(records, key=record_key, memory_limit=memory_limit)
+
+
+def iter_duplicates(records, memory_limit=SORT_MEMORY_LIMIT):
+    """Yields lists of the records sharing the same digest, records without
+    digest are ignored"""
+    records = (record for record in records if record[2] is not None)
+    by_digest = external_sort(records, key=lambda record: record[2],
+                              memory_limit=memory_limit)
+    for _, group in groupby(by_digest, key=lambda record: record[2]):
+        group = list(group)
+        if len(group) > 1:
+            yield group
+
+
+def check_order(records, name):
+    "Yields the records raising a ValueError if they aren't in path order"
+    last = None
+    for record in records:
+        key = path_key(record[0])
+        if last is not None and key < last:
+            raise ValueError(f"The {name} source isn't sorted, '{record[0]}' "
+                             f"comes after a later path")
+        last = key
+        yield record
+
+
+def same_content(a, b):
+    if a[1] != b[1]:
+        return False
+    # Without both digests the size is all we can compare
+    return a[2] is None or b[2] is None or a[2] == b[2]
+
+
+def unmatched_key(record):
+    return record[2], path_key(record[0])
+
+
+def diff(old, new, memory_limit=SORT_MEMORY_LIMIT):
+    """Yields the Changes that turn the old source into the new one.
+
+    Modified files, and removed and added ones without digest, are reported
+    as they are found. The other removed and added files are spilled to disk
+    as they may match by digest. At the end both are sorted by digest with
+    external_sort and merged, the matches are reported as moved. Memory is
+    bounded by memory_limit whatever the number of changes.
+    """
+    removed = Spool()
+    added = Spool()
+    old, new = check_order(old, "old"), check_order(new, "new")
+    a, b = next(old, None), next(new, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and path_key(a[0]) < path_key(b[0])):
+            if a[2] is None:
+                yield Change(REMOVED, a, None)
+            else:
+                removed.append(a)
+            a = next(old, None)
+        elif a is None or path_key(b[0]) < path_key(a[0]):
+            if b[2] is None:
+                yield Change(ADDED, None, b)
+            else:
+                added.append(b)
+            b = next(new, None)
+        else:
+            if not same_content(a, b):
+                yield Change(MODIFIED, a, b)
+            a, b = next(old, None), next(new, None)
+    # Records with the same digest are paired in path order
+    removed = external_sort(removed, key=unmatched_key, memory_limit=memory_limit)
+    added = external_sort(added, key=unmatched_key, memory_limit=memory_limit)
+    a, b = next(removed, None), next(added, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[2] < b[2]):
+            yield Change(REMOVED, a, None)
+            a = next(removed, None)
+        elif a is None or b[2] < a[2]:
+            yield Change(ADDED, None, b)
+            b = next(added, None)
+        else:
+            yield Change(MOVED, a, b)
+            a, b = next(removed, None), next(added, None)
+
+
+# Sources
+
+def iter_collection(collection, algorithm=DEFAULT_ALGORITHM,
+                    memory_limit=SORT_MEMORY_LIMIT):
+    "Records of the files of a built Collection"
+    root = Path(collection.path)
+    records = ((Path(file.path).relative_to(root).as_posix(), file.size,
+                digest_bytes(file.get_digest(algorithm)))
+               for file in collection.iter_files())
+    return sorted_source(records, memory_limit)
+
+
+def iter_snapshot(snapshot, collection=None, algorithm=DEFAULT_ALGORITHM,
+                  memory_limit=SORT_MEMORY_LIMIT):
+    """Records of a catalogue Snapshot, relative to the collector. The
+    snapshot is already in memory, only the sorting is bounded by
+    memory_limit."""
+    records = ((path, size, digest_bytes(digest))
+               for path, size, digest in snapshot.iter_files(collection,
+                                                             algorithm))
+    return sorted_source(records, memory_limit)
+
+
+def iter_jsonl(path, algorithm=DEFAULT_ALGORITHM):
+    """Records of a JSON Lines dump, one {"path", "size", "digests"} object
+    per line in path order as write_jsonl writes them. Older dumps have the
+    sha1 in a "sha1" key."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            data = json.loads(line)
+            digest = (data.get("digests") or {}).get(algorithm)
+            if digest is None and algorithm == DEFAULT_ALGORITHM:
+                digest = data.get("sha1")
+            yield data["path"], data["size"], digest_bytes(digest)
+
+
+def write_jsonl(records, path, algorithm=DEFAULT_ALGORITHM):
+    """Dumps records of any source so they can be compared later, their
+    digests were computed with algorithm"""
+    with open(path, "w", encoding="utf-8") as f:
+        for relative_path, size, digest in records:
+            digests = {algorithm: digest.hex()} if digest is not None else {}
+            f.write(json.dumps({"path": relative_path, "size": size,
+                                "digests": digests}) + "\n")
+
+
+def iter_manifest_entries(path, batch_size=MANIFEST_BATCH_SIZE):
+    """Yields the entries of the files list of a manifest. The list is read
+    line by line and parsed batch_size entries at a time, so the manifest is
+    never in memory at once."""
+    from .command import load
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("files:"):
+                break
+        else:
+            return
+        if line.rstrip() != "files:":
+            # A flow list in the same line, "files: []"
+            yield from load(line)["files"] or []
+            return
+        lines = []
+        entries = 0
+        prefix = None
+        for line in f:
+            if not line.strip():
+                continue
+            if prefix is None:
+                prefix = line[:len(line) - len(line.lstrip(" "))] + "- "
+            if line.startswith(prefix):
+                if entries == batch_size:
+                    yield from load("".join(lines))
+                    lines = []
+                    entries = 0
+                entries += 1
+            elif not line.startswith(" "):
+                # The next key of the manifest
+                break
+            lines.append(line)
+        if lines:
+            yield from load("".join(lines))
+
+
+def iter_manifest(path, algorithm=DEFAULT_ALGORITHM):
+    "Records of the INFO_PATH manifest of a volume, written in path order"
+    for entry in iter_manifest_entries(path):
+        digest = (entry.get("digests") or {}).get(algorithm)
+        if digest is None and algorithm == DEFAULT_ALGORITHM:
+            digest = entry.get("sha1")
+        yield entry["path"], entry["size"], digest_bytes(digest)
+
+
+def iter_walk(root, algorithm=None, excluded=()):
+    """Records of the files under root walked in order. Digests are only
+    computed when an algorithm is given."""
+    root = str(root)
+
+    def walk(directory, prefix):
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        for entry in entries:
+            relative_path = prefix + entry.name
+            if relative_path in excluded:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(entry.path, relative_path + "/")
+            elif entry.is_file(follow_symlinks=False):
+                digest = None
+                if algorithm is not None:
+                    digest = get_digests_file(entry.path, (algorithm,))[algorithm]
+                yield (relative_path, entry.stat(follow_symlinks=False).st_size,
+                       digest_bytes(digest))
+
+    return walk(root, "")
+
+
+def open_source(path, algorithm=DEFAULT_ALGORITHM, hash_files=False,
+                memory_limit=SORT_MEMORY_LIMIT):
+    """Guesses the kind of source from its path: a directory is walked, .jsonl
+    files are dumps, .yml files volume manifests and anything else a
+    catalogue snapshot"""
+    from .command import TAG, INFO_PATH
+    path = Path(path)
+    if path.is_dir():
+        excluded = (TAG, INFO_PATH.split("/")[0])
+        return iter_walk(path, algorithm if hash_files else None, excluded)
+    if path.suffix == ".jsonl":
+        return iter_jsonl(path, algorithm)
+    if path.suffix in (".yml", ".yaml"):
+        return iter_manifest(path, algorithm)
+    from .snapshot import Snapshot
+    if path.stat().st_size > memory_limit:
+        logger.warning("The snapshot %s is larger than the memory limit, it is "
+                       "loaded in memory as a whole", path)
+    return iter_snapshot(Snapshot.read(path), algorithm=algorithm,
+                         memory_limit=memory_limit)
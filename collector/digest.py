@@ -0,0 +1,76 @@
+import os
+import time
+import hashlib
+
+DEFAULT_ALGORITHM = "sha1"
+BUF_SIZE = 1024 * 1024
+
+ALGORITHMS = {
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+    "blake2s": hashlib.blake2s,
+}
+
+try:
+    from blake3 import blake3
+    ALGORITHMS["blake3"] = blake3
+except ImportError:
+    pass
+
+
+def get_hasher(algorithm):
+    try:
+        return ALGORITHMS[algorithm]()
+    except KeyError:
+        raise ValueError(f"Unknown digest algorithm '{algorithm}'")
+
+
+def get_digests_file(path, algorithms=(DEFAULT_ALGORITHM,), buffer_size=BUF_SIZE,
+                     throttle=None):
+    """Computes the digests of a file with several algorithms reading it only
+    once, returns a dictionary of algorithm: hexdigest. throttle, when given,
+    is called with the bytes and the seconds taken by each read."""
+    hashers = [(algorithm, get_hasher(algorithm)) for algorithm in algorithms]
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            start = time.perf_counter()
+            n = f.readinto(buf)
+            if not n:
+                break
+            if throttle is not None:
+                throttle(n, time.perf_counter() - start)
+            for _, hasher in hashers:
+                hasher.update(view[:n])
+    return {algorithm: hasher.hexdigest() for algorithm, hasher in hashers}
+
+
+def digest_bytes(hexdigest):
+    "Raw bytes of a hexdigest, they are compared and hashed faster"
+    return bytes.fromhex(hexdigest) if hexdigest else None
+
+
+def get_digest_var(data, algorithm=DEFAULT_ALGORITHM):
+    hasher = get_hasher(algorithm)
+    hasher.update(data)
+    return hasher.hexdigest()
+
+
+def benchmark(algorithms=None, size=256 * 1024 * 1024, buffer_size=BUF_SIZE):
+    "Returns the throughput of each algorithm in MB/s hashing size bytes"
+    if algorithms is None:
+        algorithms = list(ALGORITHMS)
+    data = memoryview(os.urandom(buffer_size))
+    results = {}
+    for algorithm in algorithms:
+        hasher = get_hasher(algorithm)
+        rounds = max(size // buffer_size, 1)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            hasher.update(data)
+        hasher.digest()
+        elapsed = time.perf_counter() - start
+        results[algorithm] = rounds * buffer_size / (1024 * 1024) / elapsed
+    return results
@@ -0,0 +1,328 @@
+"""Distributed hashing of a collection through a work-queue protocol.
+
+A Coordinator splits the files of a collection in chunks and leases them to
+workers, every worker runs on a host that mounts the master at some path and
+receives paths relative to it. The protocol is one JSON object per line:
+
+    coordinator -> worker  {"lease": id, "task": "digest", "paths": [...],
+                            "args": {"algorithms": [...]}}
+    worker -> coordinator  {"lease": id, "results": {path: result}}
+                           {"lease": id, "error": message}
+
+The tasks are "digest", that returns the digests of each file, and
+"thumbnail", that writes the thumbnail of each image and returns its
+perceptual hash.
+
+Workers can be local processes talking through stdin/stdout
+
+    python -m collector.distributed worker ROOT
+
+or remote ones connecting to the coordinator socket
+
+    python -m collector.distributed worker ROOT --connect HOST:PORT
+
+A lease that isn't answered before it expires, or whose worker dies, is
+handed to another worker. The worker of an expired lease may hang forever,
+local ones are killed and the connection of remote ones is shut down. Local
+workers that die are started again.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import subprocess
+from pathlib import Path
+from .command import logger
+from .digest import get_digests_file, DEFAULT_ALGORITHM
+
+CHUNK_SIZE = 64
+LEASE_TIMEOUT = 10 * 60
+
+
+def digest_task(root, paths, algorithms):
+    return {path: get_digests_file(Path(root, path), algorithms)
+            for path in paths}
+
+
+def thumbnail_task(root, paths, thumbnail_path):
+    "Thumbnails are written under thumbnail_path, relative to root"
+    from .perceptual import compute_thumbnail_and_dhash, get_thumbnail_path
+    results = {}
+    for path in paths:
+        target = get_thumbnail_path(Path(root, thumbnail_path), path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        results[path] = compute_thumbnail_and_dhash(Path(root, path), target)
+    return results
+
+
+# Tasks are called with the worker root, the chunk paths and the request
+# arguments
+TASKS = {
+    "digest": digest_task,
+    "thumbnail": thumbnail_task,
+}
+
+
+def run_worker(root, rfile, wfile):
+    "Serves leases read from rfile until it is closed"
+    for line in rfile:
+        request = json.loads(line)
+        lease = request["lease"]
+        try:
+            task = TASKS[request["task"]]
+            results = task(root, request["paths"], **request["args"])
+            response = {"lease": lease, "results": results}
+        except Exception as e:
+            response = {"lease": lease, "error": str(e)}
+        wfile.write(json.dumps(response) + "\n")
+        wfile.flush()
+
+
+class Lease:
+    def __init__(self, id, paths):
+        self.id = id
+        self.paths = paths
+        self.expires = None
+        self.attempts = 0
+        # Stops the worker holding the lease
+        self.abort = None
+
+
+class Coordinator:
+    """Hands out chunks of the files of a collection to workers and merges the
+    results back into the File objects.
+
+    files are the files to process, all the files of the collection by
+    default, and args the arguments of the task, the digest algorithms of
+    the collection for "digest". callbacks maps the relative paths of files
+    to functions that take their results instead of the default merge.
+    """
+
+    def __init__(self, collection, task="digest", args=None, files=None,
+                 callbacks=None, chunk_size=CHUNK_SIZE,
+                 lease_timeout=LEASE_TIMEOUT, max_attempts=3):
+        self.collection = collection
+        self.task = task
+        if args is None and task == "digest":
+            args = {"algorithms": list(getattr(
+                collection, "digest_algorithms", (DEFAULT_ALGORITHM,)))}
+        self.args = args or {}
+        self.callbacks = callbacks or {}
+        self.chunk_size = chunk_size
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.root = Path(collection.path)
+        self.files = {}
+        if files is None:
+            files = collection.iter_files()
+        for file in files:
+            self.files[str(Path(file.path).relative_to(self.root))] = file
+        paths = sorted(self.files)
+        self.pending = [Lease(n, paths[i:i + chunk_size])
+                        for n, i in enumerate(range(0, len(paths), chunk_size))]
+        self.leased = {}
+        self.failed = []
+        self.condition = threading.Condition()
+
+    @property
+    def done(self):
+        return not self.pending and not self.leased
+
+    def next_lease(self, abort=None):
+        """Returns the next lease to hand out or None when all are finished.
+        abort stops the worker taking it if the lease expires."""
+        with self.condition:
+            while True:
+                self.expire_leases()
+                if self.pending:
+                    lease = self.pending.pop(0)
+                    lease.attempts += 1
+                    lease.expires = time.monotonic() + self.lease_timeout
+                    lease.abort = abort
+                    self.leased[lease.id] = lease
+                    return lease
+                if not self.leased:
+                    return None
+                # Wait for running leases, they may expire and come back
+                self.condition.wait(1)
+
+    def expire_leases(self):
+        now = time.monotonic()
+        for lease in list(self.leased.values()):
+            if lease.expires < now:
+                logger.warning("Lease %d expired", lease.id)
+                if lease.abort is not None:
+                    lease.abort()
+                self.retry(lease)
+
+    def retry(self, lease):
+        del self.leased[lease.id]
+        if lease.attempts < self.max_attempts:
+            self.pending.append(lease)
+        else:
+            self.failed.append(lease)
+        self.condition.notify_all()
+
+    def complete(self, response):
+        with self.condition:
+            lease = self.leased.get(response["lease"])
+            if lease is None:
+                # Expired and handed to another worker that already answered
+                return
+            if "error" in response:
+                logger.warning("Lease %d failed: %s", lease.id, response["error"])
+                self.retry(lease)
+                return
+            for path, result in response["results"].items():
+                callback = self.callbacks.get(path)
+                if callback is not None:
+                    callback(result)
+                else:
+                    self.merge(self.files[path], result)
+            del self.leased[lease.id]
+            self.condition.notify_all()
+
+    def merge(self, file, result):
+        if self.task == "digest":
+            file.set_digests(result)
+        elif self.task == "thumbnail":
+            file.set_phash(result)
+
+    def check(self):
+        "Raises an error if some leases were neither finished nor failed"
+        with self.condition:
+            unfinished = len(self.pending) + len(self.leased)
+        if unfinished:
+            raise RuntimeError(f"{unfinished} chunks were left unfinished")
+
+    def request(self, lease):
+        return json.dumps({"lease": lease.id, "task": self.task,
+                           "paths": lease.paths, "args": self.args}) + "\n"
+
+    def feed(self, rfile, wfile, abort=None):
+        """Runs leases through a worker connection until there is no work
+        left, returns False if the worker died or was aborted before"""
+        while True:
+            lease = self.next_lease(abort)
+            if lease is None:
+                return True
+            try:
+                wfile.write(self.request(lease))
+                wfile.flush()
+                line = rfile.readline()
+            except OSError:
+                line = ""
+            if not line:
+                # The worker died, its lease goes back to the queue unless
+                # it expired and was handed out again
+                with self.condition:
+                    if (self.leased.get(lease.id) is lease and
+                            lease.abort is abort):
+                        self.retry(lease)
+                return False
+            self.complete(json.loads(line))
+
+    def worker_command(self):
+        return [sys.executable, "-m", "collector.distributed", "worker",
+                str(self.root)]
+
+    def feed_local(self):
+        "Feeds a local worker process, starting a new one each time it dies"
+        while True:
+            process = subprocess.Popen(
+                self.worker_command(), stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, text=True,
+                cwd=Path(__file__).resolve().parent.parent)
+            try:
+                finished = self.feed(process.stdout, process.stdin,
+                                     abort=process.kill)
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+                process.stdout.close()
+                process.wait()
+            if finished:
+                return
+            logger.warning("Worker %d died, starting a new one", process.pid)
+
+    def run_local(self, workers=None):
+        """Runs the collection through local worker processes, they stand in
+        for remote hosts sharing the master mount. Returns the failed
+        leases."""
+        workers = workers or os.cpu_count()
+        threads = [threading.Thread(target=self.feed_local)
+                   for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        self.join(threads)
+        self.check()
+        return self.failed
+
+    def join(self, threads):
+        """Waits for the feeder threads, expiring the leases meanwhile as all
+        the feeders may be waiting for hung workers"""
+        for thread in threads:
+            while thread.is_alive():
+                with self.condition:
+                    self.expire_leases()
+                thread.join(1)
+
+    def serve(self, host, port):
+        "Waits for remote workers until all the leases are finished"
+        server = socket.create_server((host, port))
+        server.settimeout(1)
+        threads = []
+        try:
+            while not self.done:
+                try:
+                    conn, address = server.accept()
+                except socket.timeout:
+                    with self.condition:
+                        self.expire_leases()
+                    continue
+                logger.info("Worker connected from %s:%d", *address[:2])
+                thread = threading.Thread(target=self.serve_connection,
+                                          args=(conn,), daemon=True)
+                thread.start()
+                threads.append(thread)
+            self.join(threads)
+        finally:
+            server.close()
+        self.check()
+        return self.failed
+
+    def serve_connection(self, conn):
+        def abort():
+            # Wakes up the feeder reading from the connection
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        with conn, conn.makefile("r") as rfile, conn.makefile("w") as wfile:
+            self.feed(rfile, wfile, abort=abort)
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers()
+    worker_parser = subparsers.add_parser("worker", description="hash the chunks sent by a coordinator")
+    worker_parser.add_argument("root", help="where this host mounts the collection")
+    worker_parser.add_argument("--connect", help="coordinator HOST:PORT")
+    args = parser.parse_args(argv)
+    if args.connect:
+        host, port = args.connect.rsplit(":", 1)
+        with socket.create_connection((host, int(port))) as conn:
+            with conn.makefile("r") as rfile, conn.makefile("w") as wfile:
+                run_worker(args.root, rfile, wfile)
+    else:
+        run_worker(args.root, sys.stdin, sys.stdout)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
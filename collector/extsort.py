@@ -0,0 +1,126 @@
+"""Sorting of catalogue streams larger than memory.
+
+Records are gathered until they fill memory_limit bytes, then they are
+sorted and spilled to a temporary file as a run. The runs are merged back
+with heapq.merge, so only one buffer per run is in memory while merging.
+"""
+import sys
+import heapq
+import pickle
+import tempfile
+from itertools import islice
+from .command import SORT_MEMORY_LIMIT
+
+# Records per pickle in the runs, and runs merged at once
+CHUNK_SIZE = 1024
+MAX_RUNS = 128
+SAMPLE_SIZE = 100
+
+
+def record_size(record):
+    "Approximate memory taken by a record of builtin types"
+    size = sys.getsizeof(record)
+    if isinstance(record, (tuple, list)):
+        size += sum(record_size(field) for field in record)
+    elif isinstance(record, dict):
+        size += sum(record_size(k) + record_size(v) for k, v in record.items())
+    return size
+
+
+def write_run(records, tmpdir):
+    run = tempfile.TemporaryFile(dir=tmpdir)
+    for start in range(0, len(records), CHUNK_SIZE):
+        pickle.dump(records[start:start + CHUNK_SIZE], run,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    run.seek(0)
+    return run
+
+
+def read_run(run):
+    with run:
+        while True:
+            try:
+                chunk = pickle.load(run)
+            except EOFError:
+                return
+            yield from chunk
+
+
+def external_sort(records, key=None, memory_limit=SORT_MEMORY_LIMIT, tmpdir=None):
+    """Yields records sorted by key using about memory_limit bytes at most.
+    When everything fits in memory no file is written."""
+    records = iter(records)
+    sample = list(islice(records, SAMPLE_SIZE))
+    if not sample:
+        return
+    average = sum(record_size(record) for record in sample) / len(sample)
+    # Sorting keeps a list of pointers and the keys besides the records
+    run_length = max(SAMPLE_SIZE, int(memory_limit / (average * 2 + 16)))
+
+    runs = []
+    buffer = sample
+    while True:
+        buffer.extend(islice(records, run_length - len(buffer)))
+        if len(buffer) < run_length:
+            break
+        buffer.sort(key=key)
+        runs.append(write_run(buffer, tmpdir))
+        buffer = []
+        if len(runs) >= MAX_RUNS:
+            # Too many open runs, merge them in a bigger one
+            merged = merge_runs(runs, key)
+            runs = [write_stream(merged, tmpdir)]
+    buffer.sort(key=key)
+    if not runs:
+        yield from buffer
+        return
+    if buffer:
+        runs.append(write_run(buffer, tmpdir))
+    del buffer
+    yield from merge_runs(runs, key)
+
+
+class Spool:
+    """Records written to a temporary file as they come, CHUNK_SIZE at a
+    time, and read back once in the same order"""
+
+    def __init__(self, tmpdir=None):
+        self.tmpdir = tmpdir
+        self.file = None
+        self.buffer = []
+
+    def append(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) == CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(dir=self.tmpdir)
+        pickle.dump(self.buffer, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.buffer = []
+
+    def __iter__(self):
+        if self.file is None:
+            # Everything fitted in the buffer
+            yield from self.buffer
+            return
+        if self.buffer:
+            self.flush()
+        self.file.seek(0)
+        yield from read_run(self.file)
+
+
+def merge_runs(runs, key):
+    return heapq.merge(*[read_run(run) for run in runs], key=key)
+
+
+def write_stream(records, tmpdir):
+    run = tempfile.TemporaryFile(dir=tmpdir)
+    while True:
+        chunk = list(islice(records, CHUNK_SIZE))
+        if not chunk:
+            break
+        pickle.dump(chunk, run, protocol=pickle.HIGHEST_PROTOCOL)
+    run.seek(0)
+    return run
@@ -1,18 +1,33 @@
 from pathlib import Path
-from crypto import get_sha1_file
+from .digest import get_digests_file, digest_bytes, DEFAULT_ALGORITHM
 
 class File:
-    "Represents a file in the filesystem controlled by the collection"
+    """Represents a file in the filesystem controlled by the collection
+
+    Files are equal when their keys, (path relative to the collection, size,
+    digest bytes), are. The digest is the one of the first algorithm of the
+    collection, sha1 by default. The key is cached, so files must not change while they are in a
+    set or used as dictionary keys."""
+
+    _key = None
 
     class Builder:
-        def __init__(self):
+        def __init__(self, file_class=None):
+            # The class built, File subclasses share this builder
+            self.file_class = file_class or File
             self.path = ""
+            self.relative_path = None
             self.size = 0
             self.sha1 = ""
+            self.digests = {}
             self.item = None
 
         def set_path(self, path):
-            self.relative_path = Path(path)
+            self.path = Path(path)
+            return self
+
+        def set_relative_path(self, relative_path):
+            self.relative_path = Path(relative_path)
             return self
 
         def set_size(self, value):
@@ -23,17 +38,30 @@ class File:
             self.sha1 = sha1
             return self
 
+        def set_digests(self, digests):
+            self.digests = digests
+            return self
+
         def set_item(self, item):
             self.item = item
             return self
 
         def build(self):
-            return File(self.path, self.size, sha1=self.sha1, item=None)
-
-    def __init__(self, path, size, sha1=None, item=None):
+            file = self.file_class(self.path, self.size, sha1=self.sha1,
+                                   item=None, digests=self.digests)
+            if self.relative_path is not None:
+                # Until the file gets its item
+                file.relative_path = self.relative_path
+                file.relative_path_string = str(self.relative_path)
+            return file
+
+    def __init__(self, path, size, sha1=None, item=None, digests=None):
         self.path = path
         self.size = size
         self.sha1 = sha1
+        self.digests = dict(digests) if digests else {}
+        if sha1:
+            self.digests.setdefault(DEFAULT_ALGORITHM, sha1)
         if item is not None:
             self.set_item(item)
         else:
@@ -43,28 +71,80 @@ class File:
         self.item = item
         self.relative_path = self.path.relative_to(item.path)
         self.relative_path_string = str(self.relative_path)
+        self.reset_key()
 
     def set_sha1(self, sha1):
         self.sha1 = sha1
+        self.digests[DEFAULT_ALGORITHM] = sha1
+        self.reset_key()
+
+    def set_digests(self, digests):
+        "Sets the digests computed by get_digests_file"
+        self.digests.update(digests)
+        if DEFAULT_ALGORITHM in digests:
+            self.sha1 = digests[DEFAULT_ALGORITHM]
+        self.reset_key()
+
+    def reset_key(self):
+        "The key of the item depends on its files, it is reset too"
+        self._key = None
+        item = getattr(self, "item", None)
+        if item is not None:
+            item._key = None
+
+    @property
+    def key(self):
+        "Identifies the file and its content"
+        if self._key is None:
+            item = getattr(self, "item", None)
+            if item is not None:
+                # The file of a file item is "." in it
+                path = str(Path(item.relative_path, self.relative_path))
+            elif self.relative_path is not None:
+                path = str(self.relative_path)
+            else:
+                path = str(self.path)
+            digest = self.get_digest(self.digest_algorithms[0])
+            self._key = (path, self.size, digest_bytes(digest))
+        return self._key
+
+    def get_digest(self, algorithm=DEFAULT_ALGORITHM):
+        return self.digests.get(algorithm)
+
+    @property
+    def digest_algorithms(self):
+        "The algorithms the collection of the file wants to be computed"
+        try:
+            return self.item.collection.digest_algorithms
+        except AttributeError:
+            return (DEFAULT_ALGORITHM,)
 
     async def awaitable_async_stuff(self, pool):
         await self.compute_hash(pool)
         await self.get_size()
 
-    def compute_hash(self, pool):
-          pool.apply_async(get_sha1_file,[self.path], 
-                           self.set_sha1)
+    def compute_hash(self, pool, algorithms=None, callback=None):
+        if algorithms is None:
+            algorithms = self.digest_algorithms
+        return pool.apply_async(get_digests_file, [self.path, algorithms], 
+                                callback=callback or self.set_digests)
 
     async def get_size(self):
         return await self.path.stat().st_size
 
 
     def __eq__(self, other):
-        return repr(self) == repr(other)
+        if not isinstance(other, File):
+            return NotImplemented
+        return self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
 
 
     def __dict__(self):
-        return {"path": str(self.path), "size": self.size, "sha1": self.sha1}
+        return {"path": str(self.path), "size": self.size, "sha1": self.sha1,
+                "digests": self.digests}
 
     def __repr__(self):
         if self.sha1 is None:
@@ -83,15 +163,16 @@ class FileItemFile(File):
 
 class DirectoryItemFile(File):
     
-    def __init__(self, path, size, sha1=None, item=None):
+    def __init__(self, path, size, sha1=None, item=None, digests=None):
         self.relative_path = ""
         self.relative_path_string = ""
-        super().__init__(pat, size, sha1=sha1, item=item)
+        super().__init__(path, size, sha1=sha1, item=item, digests=digests)
     
     def set_item(self, item):
         self.item = item
         self.relative_path = self.path.relative_to(item.path)
         self.relative_path_string = str(self.relative_path)
+        self.reset_key()
 
     def __lt__(self, other):
         return self.relative_path_string.__lt__(other.relative_path_string)
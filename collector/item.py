@@ -1,10 +1,16 @@
-import hashlib
 from pathlib import Path
 from .file import File
+from .digest import get_digest_var, digest_bytes, DEFAULT_ALGORITHM
 
 
 class Item:
-    "The basic element in all the collections"
+    """The basic element in all the collections
+
+    Like files, items are equal when their keys, (relative path, size,
+    digest bytes), are and the key is cached. The digest is the one of the
+    first algorithm of the collection."""
+
+    _key = None
 
     class Builder:
         def __init__(self):
@@ -69,11 +75,13 @@ class Item:
         self.value = value
         self.volumes = volumes
         self.sha1 = sha1
+        self.digests = {DEFAULT_ALGORITHM: sha1} if sha1 else {}
         self.collection = None
 
     def set_collection(self, collection):
         self.collection = collection
         self.path = Path(collection.path, self.relative_path)
+        self._key = None
 
     @property
     def collector(self):
@@ -93,14 +101,43 @@ class Item:
         "Returns an unique identifier of the item content"
         return self.sha1
 
-    def __eq__(self, other):
+    @property
+    def digest_algorithms(self):
         try:
-            for attr in self.equality_attributes:
-                if getattr(self, attr) != getattr(other, attr):
-                    return False
-            return True
+            return self.collection.digest_algorithms
         except AttributeError:
-            return False
+            return (DEFAULT_ALGORITHM,)
+
+    def get_digest(self, algorithm=DEFAULT_ALGORITHM):
+        return self.digests.get(algorithm)
+
+    def get_digests(self):
+        "Returns a dictionary of algorithm: hexdigest"
+        return dict(self.digests)
+
+    def update_digests(self, algorithms):
+        "Computes the item digests once the digests of its files are known"
+        pass
+
+    def get_extras(self):
+        "Collection specific data to keep in the catalogue"
+        return {}
+
+    @property
+    def key(self):
+        "Identifies the item and its content"
+        if self._key is None:
+            digest = self.get_digest(self.digest_algorithms[0])
+            self._key = (str(self.relative_path), self.size, digest_bytes(digest))
+        return self._key
+
+    def __eq__(self, other):
+        if not isinstance(other, Item):
+            return NotImplemented
+        return self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
 
     def __repr__(self):
         return f"<Item:{self.__class__.__name__} '{self.path}'>"
@@ -125,6 +162,7 @@ class FileItem(Item):
             return FileItem(self.file,
                             self.name,
                             self.collection,
+                            self.path,
                             self.relative_path,
                             self.size,
                             value=self.value,
@@ -132,20 +170,26 @@ class FileItem(Item):
                             volumes=self.volumes)
 
 
-    def __init__(self, file, name, collection, relative_path, size, value=5, 
+    def __init__(self, file, name, collection, path, relative_path, size, value=5, 
                  sha1="", volumes=[]):
         self.file = file
-        super().__init__(name, collection, relative_path, size, value=value, 
+        super().__init__(name, collection, path, relative_path, size, value=value, 
                          sha1=sha1, volumes=volumes)
 
     def iter_files(self):
         yield self.file
 
-    def __eq__(self, other):
-        try:
-            return self.file == other.file
-        except Exception:
-            return False
+    def get_hash(self):
+        return self.sha1 or self.file.sha1
+
+    def get_digest(self, algorithm=DEFAULT_ALGORITHM):
+        # The digests of a file item are the ones of its file
+        return self.digests.get(algorithm) or self.file.get_digest(algorithm)
+
+    def get_digests(self):
+        digests = dict(self.file.digests)
+        digests.update(self.digests)
+        return digests
 
     def __dict__(self, path):
         return self.file.__dict__()
@@ -170,22 +214,42 @@ class DirectoryItem(Item):
             return DirectoryItem(self.files,
                                  self.name,
                                  self.collection,
+                                 self.path,
                                  self.relative_path,
                                  self.size,
                                  value=self.value,
                                  sha1=self.sha1,
                                  volumes=self.volumes)
 
-    def __init__(self, files, name, collection, relative_path, size, value=5, 
+    def __init__(self, files, name, collection, path, relative_path, size, value=5, 
                  sha1="", volumes=[]):
-        super().__init__(name, collection, relative_path, size, value=value, 
+        super().__init__(name, collection, path, relative_path, size, value=value, 
                          sha1=sha1, volumes=volumes)
         self.files = files
         self.files.sort()
 
+    def iter_files(self):
+        for file in self.files:
+            yield file
+
+    def compute_digest(self, algorithm=DEFAULT_ALGORITHM):
+        "The item digest is the digest of the table of its files digests"
+        table = "\n".join([f"{file.get_digest(algorithm)} {file.relative_path_string}"
+                           for file in self.files])
+        digest = get_digest_var(table.encode("utf-8"), algorithm)
+        self.digests[algorithm] = digest
+        self._key = None
+        if algorithm == DEFAULT_ALGORITHM:
+            self.sha1_table = table
+            self.sha1 = digest
+        return digest
+
     def compute_sha1(self):
-        self.sha1_table = "\n".join([str(file) for file in self.files])
-        self.sha1 = hashlib.sha1(self.sha1_table.encode("utf-8")).hexdigest()
+        return self.compute_digest(DEFAULT_ALGORITHM)
+
+    def update_digests(self, algorithms):
+        for algorithm in algorithms:
+            self.compute_digest(algorithm)
 
     def __dict__(self, path):
         return {"name": self.name, "size": self.size,
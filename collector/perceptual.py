@@ -0,0 +1,126 @@
+"""Perceptual hashes to find near duplicate images, re-encoded or resized
+copies that exact hashes miss.
+
+dhash() reduces an image to 9x8 gray pixels and keeps one bit per pair of
+horizontal neighbours, similar images get hashes a few bits apart. Pillow is
+only needed to compute them, not to search them.
+"""
+from pathlib import Path
+
+HASH_BITS = 64
+DEFAULT_THRESHOLD = 4
+THUMBNAIL_SIZE = (256, 256)
+THUMBNAIL_SUFFIX = ".jpg"
+HAS_BIT_COUNT = hasattr(int, "bit_count")
+
+
+def hamming(a, b):
+    "Number of different bits, int.bit_count() is only in Python 3.10+"
+    if HAS_BIT_COUNT:
+        return (a ^ b).bit_count()
+    return bin(a ^ b).count("1")
+
+
+def get_thumbnail_path(thumbnails_path, relative_path):
+    """Where the thumbnail of the image at relative_path is written, the
+    suffix is appended so a.jpg and a.png don't share it"""
+    return Path(thumbnails_path, str(relative_path) + THUMBNAIL_SUFFIX)
+
+
+def dhash(image):
+    "64 bits difference hash of a Pillow image"
+    from PIL import Image
+    small = image.convert("L").resize((9, 8), Image.BILINEAR)
+    # One byte per gray pixel
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            right = pixels[row * 9 + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def compute_thumbnail_and_dhash(path, thumbnail_path, size=THUMBNAIL_SIZE):
+    """Decodes the image once to write its thumbnail and compute its dhash,
+    JPEG images are decoded directly at a reduced scale"""
+    from PIL import Image
+    with Image.open(path) as image:
+        image.draft("RGB", size)
+        image.load()
+        value = dhash(image)
+        image.thumbnail(size)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(thumbnail_path, "JPEG")
+    return value
+
+
+class MultiIndexHash:
+    """Index of hashes answering which ones are within a hamming distance
+    without comparing every pair.
+
+    Hashes are cut in threshold + 1 substrings, one table per substring. Two
+    hashes differing in threshold bits or less have at least one identical
+    substring, so only the hashes sharing a substring are compared.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, bits=HASH_BITS):
+        self.threshold = threshold
+        parts = threshold + 1
+        self.slices = []
+        start = 0
+        for n in range(parts):
+            width = bits // parts + (1 if n < bits % parts else 0)
+            self.slices.append((start, (1 << width) - 1))
+            start += width
+        self.tables = [{} for _ in self.slices]
+
+    def keys(self, value):
+        return [(value >> shift) & mask for shift, mask in self.slices]
+
+    def add(self, value, id):
+        for table, key in zip(self.tables, self.keys(value)):
+            table.setdefault(key, []).append((value, id))
+
+    def query(self, value):
+        "Returns the ids of the hashes within the threshold of value"
+        threshold = self.threshold
+        found = set()
+        for table, key in zip(self.tables, self.keys(value)):
+            found.update(id for other, id in table.get(key, ())
+                         if hamming(value, other) <= threshold)
+        return found
+
+
+def find_clusters(hashes, threshold=DEFAULT_THRESHOLD):
+    """Groups the ids of hashes, a dictionary of id: hash, in clusters of near
+    duplicates. Only clusters with more than one id are returned."""
+    parent = {}
+
+    def find(id):
+        while parent[id] != id:
+            parent[id] = parent[parent[id]]
+            id = parent[id]
+        return id
+
+    # Identical hashes are one entry in the index
+    by_value = {}
+    for id, value in hashes.items():
+        parent[id] = id
+        by_value.setdefault(value, []).append(id)
+
+    index = MultiIndexHash(threshold)
+    for value, ids in by_value.items():
+        first = ids[0]
+        for id in ids[1:]:
+            parent[find(id)] = find(first)
+        for other in index.query(value):
+            parent[find(other)] = find(first)
+        index.add(value, first)
+
+    clusters = {}
+    for id in hashes:
+        clusters.setdefault(find(id), []).append(id)
+    return [ids for ids in clusters.values() if len(ids) > 1]
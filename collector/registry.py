@@ -0,0 +1,155 @@
+import importlib
+from .digest import DEFAULT_ALGORITHM
+
+ENTRY_POINT_GROUP = "jmcollector.collections"
+
+# Types shipped with the package, as "module:Class" so nothing is imported
+# until a collection of that type is used
+BUILTIN_TYPES = {
+    "files": ".collection:FileCollection",
+    "directories": ".collection:DirectoryCollection",
+    "images": ".collections.images:ImageCollection",
+}
+
+DISTRIBUTED_SETTINGS = ("workers", "address")
+
+
+def parse_distributed(data, where):
+    """Returns the workers and the (host, port) address of the distributed
+    build settings data, the address is None when the workers are local"""
+    if not isinstance(data, dict):
+        raise ValueError(f"The distributed settings of {where} must be a mapping")
+    unknown = set(data) - set(DISTRIBUTED_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown distributed settings {sorted(unknown)} "
+                         f"in {where}")
+    address = data.get("address")
+    if address is not None:
+        host, _, port = str(address).rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError(f"The distributed address of {where} must be "
+                             f"HOST:PORT, not '{address}'")
+        address = (host, int(port))
+    return data.get("workers"), address
+
+
+class CollectionRegistry:
+    """Maps collection type names to their classes, importing each class the
+    first time it is asked for.
+
+    Types come from BUILTIN_TYPES, from the "types" section of the settings
+    file and from the jmcollector.collections entry point group of installed
+    packages, the entry points are only scanned when a name isn't found."""
+
+    def __init__(self, types=None):
+        self.types = dict(BUILTIN_TYPES if types is None else types)
+        self.classes = {}
+        self.discovered = False
+
+    def register(self, name, target):
+        "target is a class or a 'module:Class' string"
+        if isinstance(target, str):
+            self.types[name] = target
+            self.classes.pop(name, None)
+        else:
+            self.classes[name] = target
+
+    def discover(self):
+        self.discovered = True
+        from importlib.metadata import entry_points
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            self.types.setdefault(entry_point.name, entry_point.value)
+
+    def get(self, name):
+        if name in self.classes:
+            return self.classes[name]
+        if name not in self.types and not self.discovered:
+            self.discover()
+        try:
+            target = self.types[name]
+        except KeyError:
+            raise ValueError(f"Unknown collection type '{name}'")
+        module_name, class_name = target.split(":")
+        module = importlib.import_module(module_name, package=__package__)
+        cls = getattr(module, class_name)
+        self.classes[name] = cls
+        return cls
+
+    def __contains__(self, name):
+        return name in self.classes or name in self.types
+
+
+registry = CollectionRegistry()
+
+
+class CollectionSettings:
+    """Per collection tuning read from the collections section of the
+    settings file (COLLECTION_SETTINGS):
+
+        collections:
+          photos:
+            type: images
+            path: Photos
+            workers: 4
+            digest: [sha1, blake2b]
+            cache: snapshot
+            chunk_size: 64
+            throttle:
+              rate: 52428800
+              latency_target: 0.05
+          music:
+            distributed:
+              workers: 8
+              address: 0.0.0.0:7077
+
+    throttle holds the arguments of the IOGovernor limiting the reads of the
+    builds of the collection. distributed spreads the hashing among workers,
+    remote ones connecting to the address or local processes without it.
+    """
+
+    defaults = {
+        "type": "directories",
+        "path": None,
+        "workers": None,            # Processes hashing, None is one per CPU
+        "digest": [DEFAULT_ALGORITHM],
+        "cache": "snapshot",        # "snapshot" or "none"
+        "chunk_size": 64,           # Files per lease in distributed builds
+        "throttle": None,           # IOGovernor arguments, None is unlimited
+        "distributed": None,        # Workers and address, None builds locally
+    }
+
+    def __init__(self, name, data=None):
+        self.name = name
+        data = data or {}
+        unknown = set(data) - set(self.defaults)
+        if unknown:
+            raise ValueError(f"Unknown settings {sorted(unknown)} in collection '{name}'")
+        for key, default in self.defaults.items():
+            setattr(self, key, data.get(key, default))
+        if self.path is None:
+            self.path = name
+        if isinstance(self.digest, str):
+            self.digest = [self.digest]
+        if self.throttle is not None:
+            from .throttle import GOVERNOR_SETTINGS
+            unknown = set(self.throttle) - set(GOVERNOR_SETTINGS)
+            if unknown:
+                raise ValueError(f"Unknown throttle settings {sorted(unknown)} "
+                                 f"in collection '{name}'")
+        self.get_distributed()
+
+    def get_governor(self):
+        "Returns the IOGovernor of the throttle settings or None"
+        if self.throttle is None:
+            return None
+        from .throttle import IOGovernor
+        return IOGovernor(**self.throttle)
+
+    def get_distributed(self):
+        "Returns the workers and address of distributed builds or None"
+        if self.distributed is None:
+            return None
+        return parse_distributed(self.distributed, f"collection '{self.name}'")
+
+    def __repr__(self):
+        return f"<CollectionSettings '{self.name}' type:'{self.type}'>"
@@ -0,0 +1,226 @@
+import math
+import time
+import heapq
+
+# The exact search is only tried with up to EXACT_LIMIT candidate volumes and
+# EXACT_ELEMENTS groups of items to cover, and it gives up after NODE_BUDGET
+# nodes or TIME_BUDGET seconds keeping the best cover found
+EXACT_LIMIT = 24
+EXACT_ELEMENTS = 256
+NODE_BUDGET = 50000
+TIME_BUDGET = 0.25
+
+
+def volume_id(volume):
+    return getattr(volume, "id", volume)
+
+
+def required_copies(value, total_volumes):
+    """Number of volumes an item should be in according to its value, it
+    follows the same rules as compute_alpha"""
+    if value <= 1 or total_volumes == 0:
+        return 1
+    if value >= 10:
+        return total_volumes
+    return max(1, math.ceil(float(value) / 10 * total_volumes))
+
+
+def under_replicated(items, total_volumes):
+    "Yields (item, copies, required copies) for items needing more copies"
+    for item in items:
+        copies = len(set(volume_id(volume) for volume in item.volumes))
+        required = required_copies(item.value, total_volumes)
+        if copies < required:
+            yield item, copies, required
+
+
+class RestorePlan:
+    """The volumes to read, in order, with the items to read from each one"""
+
+    def __init__(self, reads, missing):
+        self.reads = reads          # [(volume id, [items])]
+        self.missing = missing      # Items that aren't in any volume
+
+    @property
+    def swaps(self):
+        return len(self.reads)
+
+    @property
+    def size(self):
+        return sum(item.size for _, items in self.reads for item in items)
+
+    def __repr__(self):
+        return f"<RestorePlan volumes:{self.swaps} missing:{len(self.missing)}>"
+
+
+class RestorePlanner:
+    """Finds the volumes needed to restore a group of items with the fewest disc
+    swaps.
+
+    It is a weighted set cover: volumes are the sets, items the elements and
+    each volume costs volume_cost(volume id), one swap by default. A lazy greedy
+    pass picks the volume covering more bytes per cost each time, then, when
+    there are few candidate volumes left, a branch and bound search looks for
+    a cheaper exact cover.
+
+    Items held by the same candidate volumes are a single element for the
+    search, and volumes whose items are all in a volume that costs no more
+    are left out of it. The search is bounded by the number of elements and
+    by a node and a time budget, when they are exceeded the best cover found
+    so far, at worst the greedy one, is used.
+    """
+
+    def __init__(self, items, volume_cost=None, exact_limit=EXACT_LIMIT,
+                 exact_elements=EXACT_ELEMENTS, node_budget=NODE_BUDGET,
+                 time_budget=TIME_BUDGET):
+        self.items = list(items)
+        self.volume_cost = volume_cost or (lambda volume: 1)
+        self.exact_limit = exact_limit
+        self.exact_elements = exact_elements
+        self.node_budget = node_budget
+        self.time_budget = time_budget
+
+    def plan(self):
+        members = {}    # volume id: [item indexes]
+        covering = []   # item index: [volume ids]
+        missing = []
+        for index, item in enumerate(self.items):
+            volumes = list(set(volume_id(volume) for volume in item.volumes))
+            covering.append(volumes)
+            if not volumes:
+                missing.append(item)
+            for volume in volumes:
+                members.setdefault(volume, []).append(index)
+        uncovered = set(index for index, volumes in enumerate(covering) if volumes)
+
+        # Items in a single volume force it
+        chosen = set(volumes[0] for volumes in covering if len(volumes) == 1)
+        for volume in chosen:
+            uncovered.difference_update(members[volume])
+
+        candidates = [volume for volume in members
+                      if volume not in chosen
+                      and not uncovered.isdisjoint(members[volume])]
+        chosen = list(chosen)
+        if len(candidates) <= self.exact_limit:
+            chosen.extend(self.exact_cover(candidates, members, covering, uncovered))
+        else:
+            chosen.extend(self.greedy_cover(candidates, members, covering, uncovered))
+        return self.build_plan(chosen, members, missing)
+
+    def greedy_cover(self, candidates, members, covering, uncovered):
+        """Lazy greedy, the gain of each volume is updated as the items it
+        holds get covered and stale heap entries are pushed back"""
+        uncovered = set(uncovered)
+        sizes = [item.size or 1 for item in self.items]
+        gains = {volume: sum(sizes[i] for i in members[volume] if i in uncovered)
+                 for volume in candidates}
+        costs = {volume: self.volume_cost(volume) for volume in candidates}
+
+        def ratio(volume):
+            # Free volumes come first
+            if not gains[volume]:
+                return 0
+            return gains[volume] / costs[volume] if costs[volume] else math.inf
+
+        heap = [(-ratio(volume), volume) for volume in candidates]
+        heapq.heapify(heap)
+        chosen = []
+        while uncovered and heap:
+            best, volume = heapq.heappop(heap)
+            current = ratio(volume)
+            if not current:
+                continue
+            if current < -best:
+                heapq.heappush(heap, (-current, volume))
+                continue
+            chosen.append(volume)
+            for i in members[volume]:
+                if i in uncovered:
+                    uncovered.discard(i)
+                    for other in covering[i]:
+                        if other in gains:
+                            gains[other] -= sizes[i]
+        return chosen
+
+    def exact_cover(self, candidates, members, covering, uncovered):
+        "Branch and bound over the candidates, started from the greedy result"
+        best = self.greedy_cover(candidates, members, covering, uncovered)
+        costs = {volume: self.volume_cost(volume) for volume in candidates}
+        best_cost = sum(costs[volume] for volume in best)
+        elements = set(frozenset(volume for volume in covering[i] if volume in costs)
+                       for i in uncovered)
+        if not elements or len(elements) > self.exact_elements:
+            return best
+        # The elements in fewer volumes get the lowest bits, the search
+        # branches on them first
+        masks = dict.fromkeys(candidates, 0)
+        for n, element in enumerate(sorted(elements, key=len)):
+            for volume in element:
+                masks[volume] |= 1 << n
+        candidates = self.prune_dominated(candidates, masks, costs)
+        min_cost = min(costs[volume] for volume in candidates)
+        deadline = time.monotonic() + self.time_budget
+        nodes = 0
+        stopped = False
+
+        def count(mask):
+            return bin(mask).count("1")
+
+        def search(remaining, selected, cost):
+            nonlocal best, best_cost, nodes, stopped
+            if not remaining:
+                if cost < best_cost:
+                    best, best_cost = list(selected), cost
+                return
+            nodes += 1
+            if nodes > self.node_budget or time.monotonic() > deadline:
+                stopped = True
+                return
+            # Each volume covers at most widest of the remaining elements
+            widest = max(count(masks[volume] & remaining) for volume in candidates)
+            if cost + math.ceil(count(remaining) / widest) * min_cost >= best_cost:
+                return
+            # Branch on the volumes holding the lowest uncovered element
+            low = remaining & -remaining
+            options = [volume for volume in candidates if masks[volume] & low]
+            options.sort(key=lambda volume: -count(masks[volume] & remaining))
+            for volume in options:
+                selected.append(volume)
+                search(remaining & ~masks[volume], selected, cost + costs[volume])
+                selected.pop()
+                if stopped:
+                    return
+
+        search((1 << len(elements)) - 1, [], 0)
+        return best
+
+    @staticmethod
+    def prune_dominated(candidates, masks, costs):
+        """Drops the volumes whose elements are all in another volume that
+        costs no more, of equal volumes the first one is kept"""
+        kept = []
+        for n, volume in enumerate(candidates):
+            mask, cost = masks[volume], costs[volume]
+            for m, other in enumerate(candidates):
+                if other == volume or mask & ~masks[other] or costs[other] > cost:
+                    continue
+                if masks[other] != mask or costs[other] < cost or m < n:
+                    break
+            else:
+                kept.append(volume)
+        return kept
+
+    def build_plan(self, chosen, members, missing):
+        "Reads each item from the first chosen volume holding it"
+        assigned = set()
+        reads = []
+        for volume in sorted(chosen):
+            items = [i for i in members[volume] if i not in assigned]
+            if not items:
+                continue
+            assigned.update(items)
+            items = sorted((self.items[i] for i in items),
+                           key=lambda item: str(item.relative_path))
+            reads.append((volume, items))
+        return RestorePlan(reads, missing)
@@ -0,0 +1,173 @@
+import os
+import gc
+import marshal
+from pathlib import Path
+from .command import SNAPSHOT_PATH, COLLECTION_SETTINGS
+from .digest import DEFAULT_ALGORITHM
+
+MAGIC = b"JMSNAP"
+VERSION = 5
+
+# Positions of the fields in the item records
+NAME, RELATIVE_PATH, SIZE, VALUE, SHA1, VOLUMES, FILES, EXTRA, DIGESTS = range(9)
+
+
+class Snapshot:
+    """A binary image of the catalogue that can be loaded in a few milliseconds
+    instead of rebuilding the whole Collector from the filesystem.
+
+    The snapshot only holds builtin types (tuples, lists, strings and ints) and
+    it is serialized with marshal, this way loading it doesn't import any of
+    the collection classes. Each collection is stored as a list of item
+    records:
+
+        (name, relative_path, size, value, sha1, volumes, files, extra,
+         digests)
+
+    where files is a list of (relative_path, size, sha1, digests) tuples,
+    digests being a dictionary of algorithm: hexdigest, and extra the
+    collection specific data of the item (see Item.get_extras).
+
+    The snapshot also keeps the mtime of the settings file and of the
+    collection directories, adding, removing or renaming items changes them
+    and makes the snapshot stale. Changes deeper inside the items aren't
+    noticed, verify() finds the files whose size changed.
+    """
+
+    def __init__(self, collections=None, stamps=None):
+        self.collections = collections if collections is not None else {}
+        self.stamps = stamps if stamps is not None else {}
+
+    @classmethod
+    def get_path(cls, collector_path):
+        return Path(collector_path, SNAPSHOT_PATH)
+
+    @classmethod
+    def get_stamps(cls, collector_path, relative_paths):
+        "Returns a dictionary of relative path: mtime_ns, None if missing"
+        stamps = {}
+        for relative_path in relative_paths:
+            try:
+                stamps[relative_path] = os.stat(
+                    os.path.join(collector_path, relative_path)).st_mtime_ns
+            except FileNotFoundError:
+                stamps[relative_path] = None
+        return stamps
+
+    @classmethod
+    def item_record(cls, item):
+        files = []
+        for file in item.iter_files():
+            relative_path = file.relative_path
+            if relative_path is None:
+                relative_path = "."
+            files.append((str(relative_path), file.size, file.sha1 or "",
+                          dict(getattr(file, "digests", {}))))
+        volumes = [getattr(volume, "id", volume) for volume in item.volumes]
+        return (item.name, str(item.relative_path), item.size, item.value,
+                item.get_hash() or "", volumes, files, item.get_extras(),
+                item.get_digests())
+
+    @classmethod
+    def from_collector(cls, collector):
+        collections = {}
+        for collection in collector.collections:
+            settings = getattr(collection, "settings", None)
+            if settings is not None and settings.cache == "none":
+                continue
+            records = [cls.item_record(item) for item in collection.iter_items()]
+            collections[str(collection.relative_path)] = records
+        stamps = cls.get_stamps(collector.path,
+                                [COLLECTION_SETTINGS] + list(collections))
+        return cls(collections, stamps)
+
+    @classmethod
+    def read(cls, path):
+        with open(path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            version = f.read(1)
+            if magic != MAGIC or not version or version[0] != VERSION:
+                raise ValueError(f"{path} is not a valid catalogue snapshot")
+            # The garbage collector would scan the whole catalogue many times
+            # while it is being loaded, there are no cycles in it anyway.
+            enabled = gc.isenabled()
+            gc.disable()
+            try:
+                stamps = marshal.load(f)
+                return cls(marshal.load(f), stamps)
+            finally:
+                if enabled:
+                    gc.enable()
+
+    @classmethod
+    def load(cls, collector_path):
+        "Returns the collector snapshot or None if there is none"
+        path = cls.get_path(collector_path)
+        try:
+            return cls.read(path)
+        except (FileNotFoundError, ValueError, EOFError):
+            return None
+
+    def write(self, path):
+        "Writes the snapshot atomically so readers never see it half done"
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(bytes([VERSION]))
+            marshal.dump(self.stamps, f)
+            marshal.dump(self.collections, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def save(self, collector_path, force=False):
+        """Writes the snapshot of the collector. An empty snapshot doesn't
+        replace one with collections unless forced, it is most likely the
+        result of a build that found nothing."""
+        if not self.collections and not force:
+            current = self.load(collector_path)
+            if current is not None and current.collections:
+                raise ValueError("Refusing to replace the catalogue snapshot "
+                                 "with an empty one")
+        self.write(self.get_path(collector_path))
+
+    def is_stale(self, collector_path):
+        "True when the collections changed since the snapshot was taken"
+        return self.get_stamps(collector_path, self.stamps) != self.stamps
+
+    def iter_items(self, collection=None):
+        "Yields (collection relative path, item record) pairs"
+        for name, records in self.collections.items():
+            if collection is not None and name != collection:
+                continue
+            for record in records:
+                yield name, record
+
+    def iter_files(self, collection=None, algorithm=DEFAULT_ALGORITHM):
+        """Yields (path relative to the collector, size, digest) for each
+        file, the hexdigest with algorithm or None if it wasn't computed"""
+        for name, record in self.iter_items(collection):
+            item_path = os.path.join(name, record[RELATIVE_PATH])
+            for relative_path, size, sha1, digests in record[FILES]:
+                # File items store "." as their file is the item itself
+                path = os.path.normpath(os.path.join(item_path, relative_path))
+                digest = digests.get(algorithm)
+                if digest is None and algorithm == DEFAULT_ALGORITHM:
+                    digest = sha1
+                yield path, size, digest
+
+    def verify(self, collector_path, collection=None):
+        """Yields (path, reason) for each cataloged file whose size doesn't
+        match the one in the filesystem. Only stats files, use the collection
+        verification to check the hashes."""
+        for relative_path, size, _ in self.iter_files(collection):
+            path = os.path.join(collector_path, relative_path)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                yield relative_path, "missing"
+                continue
+            if st.st_size != size:
+                yield relative_path, "size"
@@ -0,0 +1,187 @@
+import os
+import time
+import shutil
+import signal
+import threading
+import subprocess
+import multiprocessing
+from .command import logger
+from .digest import get_digests_file, DEFAULT_ALGORITHM
+
+CONTROL_POLL_INTERVAL = 1
+MIN_FACTOR = 0.05
+# Arguments of IOGovernor, the throttle of the collection settings
+GOVERNOR_SETTINGS = ("rate", "burst", "nice", "ionice_class", "latency_target",
+                     "control_path")
+# Limits that can be changed in the control file
+CONTROL_SETTINGS = ("rate", "burst", "nice", "latency_target")
+
+# The governor of the current worker process, set by init_worker
+_governor = None
+
+
+class IOGovernor:
+    """Limits the read throughput of all the workers of a build so background
+    builds don't stall the rest of the machine.
+
+    * rate is a bytes/s limit shared by all the workers through a token bucket
+      living in shared memory, None means unlimited.
+    * nice and ionice_class lower the CPU and IO priority of the workers.
+    * When a read takes longer than latency_target seconds the effective rate
+      is halved, and it recovers slowly while reads are fast again. Without
+      a rate the reads are spaced out in the same proportion.
+
+    The limits can be changed while the build runs writing them in the
+    control file (yaml with rate, burst, nice and latency_target keys, the
+    ones left out don't change); it is polled every second and reread at
+    once on SIGUSR1.
+    """
+
+    def __init__(self, rate=None, burst=None, nice=None, ionice_class=None,
+                 latency_target=None, control_path=None):
+        self.rate = multiprocessing.Value("d", rate or 0, lock=False)
+        self.burst = multiprocessing.Value("d", burst or 0, lock=False)
+        self.tokens = multiprocessing.Value("d", 0, lock=False)
+        self.last = multiprocessing.Value("d", time.monotonic(), lock=False)
+        self.factor = multiprocessing.Value("d", 1.0, lock=False)
+        self.latency_target = multiprocessing.Value("d", latency_target or 0,
+                                                    lock=False)
+        self.lock = multiprocessing.Lock()
+        self.nice = nice
+        self.ionice_class = ionice_class
+        self.control_path = control_path
+        self.control_mtime = None
+        self.stopped = threading.Event()
+        self.watcher = None
+
+    def __getstate__(self):
+        # Workers started by spawn only need the shared values
+        state = self.__dict__.copy()
+        del state["stopped"]
+        del state["watcher"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.stopped = threading.Event()
+        self.watcher = None
+
+    # Worker side
+
+    def setup_worker(self):
+        if self.nice:
+            os.nice(self.nice)
+        if self.ionice_class is not None and shutil.which("ionice"):
+            subprocess.run(["ionice", "-c", str(self.ionice_class), "-p",
+                            str(os.getpid())], check=False)
+
+    def consume(self, nbytes, latency):
+        "Called after each read, sleeps as long as the limits require"
+        with self.lock:
+            self.adapt(latency)
+            factor = self.factor.value
+            rate = self.rate.value * factor
+            if rate:
+                burst = self.burst.value or rate
+                now = time.monotonic()
+                tokens = min(burst, self.tokens.value + (now - self.last.value) * rate)
+                tokens -= nbytes
+                self.tokens.value = tokens
+                self.last.value = now
+                delay = -tokens / rate if tokens < 0 else 0
+            else:
+                # Without a rate the read is made to take latency / factor
+                delay = latency * (1 / factor - 1)
+        if delay > 0:
+            time.sleep(delay)
+
+    def adapt(self, latency):
+        target = self.latency_target.value
+        if not target:
+            return
+        if latency > target:
+            self.factor.value = max(MIN_FACTOR, self.factor.value / 2)
+        else:
+            self.factor.value = min(1.0, self.factor.value * 1.05)
+
+    # Controller side
+
+    def set_limits(self, rate=None, burst=None, nice=None, latency_target=None):
+        "Changes the limits given, None keeps the current one and 0 removes it"
+        with self.lock:
+            if rate is not None:
+                self.rate.value = rate
+            if burst is not None:
+                self.burst.value = burst
+            if latency_target is not None:
+                self.latency_target.value = latency_target
+            self.factor.value = 1.0
+        if nice is not None and nice != self.nice:
+            logger.warning("The nice value of running workers can't be changed")
+
+    def read_control(self):
+        "Applies the limits of the control file if it changed, errors are logged"
+        try:
+            mtime = os.stat(self.control_path).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self.control_mtime:
+            return
+        self.control_mtime = mtime
+        from .command import load
+        try:
+            with open(self.control_path, encoding="utf-8") as f:
+                data = load(f) or {}
+        except Exception as e:
+            logger.error("Can't read the IO limits in %s: %s", self.control_path, e)
+            return
+        if not isinstance(data, dict):
+            logger.error("The IO limits in %s aren't a mapping", self.control_path)
+            return
+        unknown = sorted(set(data) - set(CONTROL_SETTINGS))
+        if unknown:
+            logger.error("Ignoring unknown IO limits %s in %s", unknown,
+                         self.control_path)
+        # Limits left out keep their value, null ones are removed
+        limits = {key: data[key] or 0 for key in CONTROL_SETTINGS if key in data}
+        logger.info("New IO limits %s", limits)
+        self.set_limits(**limits)
+
+    def watch_control(self):
+        while not self.stopped.wait(CONTROL_POLL_INTERVAL):
+            try:
+                self.read_control()
+            except Exception:
+                logger.exception("Error reading the IO limits")
+
+    def start(self):
+        if self.control_path is None:
+            return
+        self.stopped.clear()
+        self.read_control()
+        if threading.current_thread() is threading.main_thread():
+            def reload(signum, frame):
+                self.control_mtime = None
+                self.read_control()
+            signal.signal(signal.SIGUSR1, reload)
+        self.watcher = threading.Thread(target=self.watch_control, daemon=True)
+        self.watcher.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def make_pool(self, processes=None):
+        return multiprocessing.Pool(processes or os.cpu_count(),
+                                    initializer=init_worker, initargs=(self,))
+
+
+def init_worker(governor):
+    global _governor
+    _governor = governor
+    governor.setup_worker()
+
+
+def governed_digests_file(path, algorithms=(DEFAULT_ALGORITHM,)):
+    "get_digests_file throttled by the governor of the worker"
+    throttle = _governor.consume if _governor is not None else None
+    return get_digests_file(path, algorithms, throttle=throttle)
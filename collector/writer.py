@@ -0,0 +1,223 @@
+import os
+import queue
+import threading
+from pathlib import Path
+from .command import logger, dump, TAG, INFO_PATH, SORT_MEMORY_LIMIT
+from .extsort import external_sort
+from .digest import get_hasher, DEFAULT_ALGORITHM
+
+PROGRESS_PATH = ".jminfo/progress"
+BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class VerificationError(Exception):
+    "The data written doesn't match the hash in the catalogue"
+
+
+def fast_copy(source, target):
+    """Copies a file inside the kernel when the platform allows it, falling
+    back to a plain userspace copy"""
+    with open(source, "rb") as fsrc, open(target, "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        infd, outfd = fsrc.fileno(), fdst.fileno()
+        copied = 0
+        for name in ("copy_file_range", "sendfile"):
+            call = getattr(os, name, None)
+            if call is None:
+                continue
+            try:
+                while copied < size:
+                    if name == "copy_file_range":
+                        n = call(infd, outfd, size - copied)
+                    else:
+                        n = call(outfd, infd, copied, size - copied)
+                    if not n:
+                        break
+                    copied += n
+                return copied
+            except OSError:
+                # Not supported between these filesystems, try the next one
+                # from where we stopped
+                os.lseek(infd, copied, os.SEEK_SET)
+                os.lseek(outfd, copied, os.SEEK_SET)
+        while True:
+            data = fsrc.read(BUFFER_SIZE)
+            if not data:
+                return copied
+            fdst.write(data)
+            copied += len(data)
+
+
+def pipelined_copy(source, target, buffer_size=BUFFER_SIZE,
+                   algorithm=DEFAULT_ALGORITHM):
+    """Copies source to target returning its hexdigest with algorithm,
+    reading every byte only once.
+
+    Two buffers go back and forth between a reader thread, that fills and
+    hashes them, and the calling thread, that writes them, so reads and
+    writes overlap. hashlib and file IO release the GIL while working on big
+    buffers.
+    """
+    free = queue.Queue()
+    full = queue.Queue()
+    for _ in range(2):
+        free.put(bytearray(buffer_size))
+    hasher = get_hasher(algorithm)
+    errors = []
+
+    def reader():
+        try:
+            with open(source, "rb", buffering=0) as f:
+                while True:
+                    buf = free.get()
+                    if buf is None:
+                        # The writer failed
+                        break
+                    n = f.readinto(buf)
+                    if not n:
+                        break
+                    view = memoryview(buf)[:n]
+                    hasher.update(view)
+                    full.put((buf, view))
+        except Exception as e:
+            errors.append(e)
+        full.put(None)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        with open(target, "wb", buffering=0) as f:
+            while True:
+                chunk = full.get()
+                if chunk is None:
+                    break
+                buf, view = chunk
+                written = 0
+                while written < len(view):
+                    written += f.write(view[written:])
+                view.release()
+                free.put(buf)
+            os.fsync(f.fileno())
+    except BaseException:
+        # Stops the reader, it may be waiting for a free buffer
+        free.put(None)
+        thread.join()
+        raise
+    thread.join()
+    if errors:
+        raise errors[0]
+    return hasher.hexdigest()
+
+
+class VolumeWriter:
+    """Writes a planned Volume from the master directory to a target, the
+    removable media or a staging directory.
+
+    Files are copied with their path relative to the master. When verify is
+    set each file is hashed with the first digest algorithm of its collection
+    while it is copied and checked against the catalogue, otherwise the
+    kernel copies it directly.
+
+    Every finished file is recorded in a progress journal inside the target,
+    so an interrupted write resumes from where it stopped. Journaled files
+    missing in the target or with another size are copied again. The TAG
+    and the INFO_PATH manifest are written at the end, a volume having them
+    is complete.
+    """
+
+    def __init__(self, volume, master_path, target_path, verify=True,
+                 buffer_size=BUFFER_SIZE):
+        self.volume = volume
+        self.master_path = Path(master_path)
+        self.target_path = Path(target_path)
+        self.verify = verify
+        self.buffer_size = buffer_size
+        self.progress_path = Path(self.target_path, PROGRESS_PATH)
+
+    def iter_plan(self):
+        "Yields (file, path relative to master) for each file of the volume"
+        for item in self.volume.items:
+            for file in item.iter_files():
+                yield file, Path(file.path).relative_to(self.master_path)
+
+    def load_progress(self):
+        try:
+            with open(self.progress_path, encoding="utf-8") as f:
+                return set(line.rstrip("\n") for line in f)
+        except FileNotFoundError:
+            return set()
+
+    def copy_file(self, file, relative_path):
+        target = Path(self.target_path, relative_path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_target = target.with_name(target.name + ".part")
+        if self.verify:
+            algorithm = file.digest_algorithms[0]
+            expected = file.get_digest(algorithm)
+            if not expected:
+                raise VerificationError(f"{relative_path} has no {algorithm} "
+                                        f"digest in the catalogue to verify")
+            digest = pipelined_copy(file.path, tmp_target, self.buffer_size,
+                                    algorithm)
+            if digest != expected:
+                os.unlink(tmp_target)
+                raise VerificationError(f"{relative_path} {algorithm} is "
+                                        f"{digest} but {expected} was expected")
+        else:
+            fast_copy(file.path, tmp_target)
+        os.replace(tmp_target, target)
+
+    def write_manifest(self, memory_limit=SORT_MEMORY_LIMIT):
+        """Writes the manifest in path order, entry by entry, so it doesn't
+        need to be in memory at once"""
+        from .diff import path_key
+        info_path = Path(self.target_path, INFO_PATH)
+        info_path.parent.mkdir(parents=True, exist_ok=True)
+        entries = ((relative_path.as_posix(), file.size, file.sha1, file.digests)
+                   for file, relative_path in self.iter_plan())
+        entries = external_sort(entries, key=lambda entry: path_key(entry[0]),
+                                memory_limit=memory_limit)
+        with open(info_path, "w", encoding="utf-8") as f:
+            dump({"volume": self.volume.id}, f)
+            f.write("files:\n")
+            for path, size, sha1, digests in entries:
+                dump([{"path": path, "size": size, "sha1": sha1,
+                       "digests": digests}], f)
+        with open(Path(self.target_path, TAG), "w", encoding="utf-8") as f:
+            f.write(f"{self.volume.id}\n")
+
+    def is_written(self, file, relative_path):
+        "Checks that a journaled file is in the target"
+        try:
+            size = os.stat(Path(self.target_path, relative_path)).st_size
+        except FileNotFoundError:
+            logger.warning("%s is in the progress journal but not in the "
+                           "target, copying it again", relative_path)
+            return False
+        if size != file.size:
+            logger.warning("%s has %d bytes in the target instead of %d, "
+                           "copying it again", relative_path, size, file.size)
+            return False
+        return True
+
+    def write(self):
+        "Writes the volume, returns the number of files copied"
+        done = self.load_progress()
+        if done:
+            logger.info("Resuming volume %s, %d files already written",
+                        self.volume.id, len(done))
+        self.progress_path.parent.mkdir(parents=True, exist_ok=True)
+        copied = 0
+        with open(self.progress_path, "a", encoding="utf-8") as progress:
+            for file, relative_path in self.iter_plan():
+                key = str(relative_path)
+                if key in done and self.is_written(file, relative_path):
+                    continue
+                self.copy_file(file, relative_path)
+                progress.write(key + "\n")
+                progress.flush()
+                os.fsync(progress.fileno())
+                copied += 1
+        self.write_manifest()
+        os.unlink(self.progress_path)
+        return copied
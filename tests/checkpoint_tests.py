@@ -0,0 +1,125 @@
+import os
+import sys
+import hashlib
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from helpers import CollectorTreeTestCase
+from collector.collector import Collector
+from collector.checkpoint import Checkpoint
+from collector.constructor import (FileSystemCollectionConstructor,
+                                   DistributedCollectionConstructor)
+
+FAKE_SHA1 = "00" * 20
+
+
+class CheckpointTestCase(unittest.TestCase):
+    def test_partial_line(self):
+        with tempfile.TemporaryDirectory() as root:
+            checkpoint = Checkpoint(Path(root, "build.jsonl")).open()
+            checkpoint.record("a.txt", 5, 1, {"sha1": "aa"})
+            checkpoint.close()
+            # A crash in the middle of a write
+            with open(checkpoint.path, "a") as f:
+                f.write('["b.txt", 5, 1, {"sh')
+            self.assertEqual(list(checkpoint.load()), ["a.txt"])
+            checkpoint.open(resume=True)
+            checkpoint.record("c.txt", 5, 1, {"sha1": "cc"})
+            checkpoint.close()
+            self.assertEqual(checkpoint.load(), {"a.txt": (5, 1, {"sha1": "aa"}),
+                                                 "c.txt": (5, 1, {"sha1": "cc"})})
+            # Without resuming the journal starts again
+            checkpoint.open()
+            checkpoint.close()
+            self.assertEqual(checkpoint.load(), {})
+
+
+class ResumeTestCase(CollectorTreeTestCase):
+    files = {"Docs/a.txt": "hello", "Docs/b.txt": "world"}
+
+    def setUp(self):
+        super().setUp()
+        self.collector = Collector(self.root)
+        self.addCleanup(self.collector.close)
+        self.collection_class = self.collector.get_collection_class("docs")
+
+    def constructor(self, constructor_class=FileSystemCollectionConstructor):
+        return constructor_class(self.collector, self.collection_class)
+
+    def checkpoint(self, *names, mtime_change=0):
+        "Checkpoints the files with a fake digest"
+        checkpoint = self.constructor().get_checkpoint().open()
+        for name in names:
+            st = os.stat(Path(self.root, "Docs", name))
+            checkpoint.record(name, st.st_size, st.st_mtime_ns + mtime_change,
+                              {"sha1": FAKE_SHA1})
+        checkpoint.close()
+        return checkpoint
+
+    def sha1s(self, collection):
+        return {str(item.relative_path): item.file.sha1 for item in collection.items}
+
+    def test_resume(self):
+        checkpoint = self.checkpoint("a.txt")
+        collection = self.constructor().construct()
+        # The checkpointed digest is trusted, only b.txt was read
+        self.assertEqual(self.sha1s(collection),
+                         {"a.txt": FAKE_SHA1,
+                          "b.txt": hashlib.sha1(b"world").hexdigest()})
+        self.assertFalse(checkpoint.path.exists())
+
+    def test_changed_file(self):
+        self.checkpoint("a.txt", "b.txt", mtime_change=1)
+        collection = self.constructor().construct()
+        self.assertEqual(self.sha1s(collection),
+                         {"a.txt": hashlib.sha1(b"hello").hexdigest(),
+                          "b.txt": hashlib.sha1(b"world").hexdigest()})
+
+    def test_without_resume(self):
+        checkpoint = self.checkpoint("a.txt", "b.txt")
+        collection = self.constructor().construct(resume=False)
+        self.assertEqual(self.sha1s(collection)["a.txt"],
+                         hashlib.sha1(b"hello").hexdigest())
+        self.assertFalse(checkpoint.path.exists())
+
+    def test_interrupted_twice(self):
+        # A build interrupted before hashing anything keeps the journal
+        self.checkpoint("a.txt")
+        constructor = self.constructor()
+        with mock.patch.object(constructor, "compute_pending_hashes",
+                               side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                constructor.construct()
+        self.assertEqual(list(constructor.get_checkpoint().load()), ["a.txt"])
+
+    def test_interrupted(self):
+        def interrupted(collection, pending):
+            (file, callback), *_ = pending
+            callback({"sha1": FAKE_SHA1})
+            raise KeyboardInterrupt
+
+        constructor = self.constructor()
+        with mock.patch.object(constructor, "compute_pending_hashes", interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                constructor.construct()
+        self.assertEqual(list(constructor.get_checkpoint().load()), ["a.txt"])
+        docs, = self.collector.build()
+        self.assertEqual(self.sha1s(docs)["a.txt"], FAKE_SHA1)
+        self.assertEqual(constructor.get_checkpoint().load(), {})
+
+    def test_distributed(self):
+        checkpoint = self.checkpoint("a.txt")
+        constructor = self.constructor(DistributedCollectionConstructor)
+        constructor.local_workers = 2
+        collection = constructor.construct()
+        self.assertEqual(self.sha1s(collection),
+                         {"a.txt": FAKE_SHA1,
+                          "b.txt": hashlib.sha1(b"world").hexdigest()})
+        self.assertFalse(checkpoint.path.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from helpers import CollectorTreeTestCase, DOCS, write, write_settings
+from collector.collector import Collector
+from collector.snapshot import Snapshot
+from collector.daemon import CatalogueDaemon, DaemonClient
+
+
+class CatalogueDaemonTestCase(CollectorTreeTestCase):
+    # The snapshot doesn't come from the settings, there are no collections
+    collections = {}
+    files = {"a/x.txt": "hello"}
+
+    def setUp(self):
+        super().setUp()
+        self.socket_path = str(Path(self.root, "daemon.sock"))
+        record = ("x.txt", "x.txt", 5, 5, "", [], [(".", 5, "", {})], {}, {})
+        Snapshot({"a": [record]}).save(self.root)
+
+    def start(self, idle_timeout=60):
+        daemon = CatalogueDaemon(Collector, self.root, self.socket_path,
+                                 idle_timeout=idle_timeout)
+        thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            client = DaemonClient.connect(self.socket_path)
+            if client is not None:
+                self.addCleanup(client.close)
+                return thread, client
+            time.sleep(0.01)
+        self.fail("The daemon didn't start")
+
+    def test_round_trip(self):
+        thread, client = self.start()
+        self.assertEqual(client.request("ping"), "pong")
+        self.assertEqual(client.request("list"), ["a/x.txt"])
+        self.assertEqual(client.request("verify"), [])
+        # There are no collections in the settings, the rebuild is empty
+        with self.assertRaisesRegex(RuntimeError, "keeping the current catalogue"):
+            client.request("reload")
+        self.assertEqual(client.request("list"), ["a/x.txt"])
+        client.request("save")
+        self.assertEqual(list(Snapshot.load(self.root).collections), ["a"])
+        with self.assertRaisesRegex(RuntimeError, "Unknown command"):
+            client.request("format")
+        self.assertEqual(client.request("shutdown"), "bye")
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(Path(self.socket_path).exists())
+
+    def test_reload(self):
+        write_settings(self.root, {"docs": DOCS})
+        write(Path(self.root, "Docs", "b.txt"), "world")
+        thread, client = self.start()
+        self.assertEqual(client.request("reload"), 1)
+        self.assertEqual(client.request("list"), ["Docs/b.txt"])
+        client.request("save")
+        self.assertEqual(list(Snapshot.load(self.root).collections), ["Docs"])
+        client.request("shutdown")
+        thread.join(5)
+
+    def test_snapshot_replaced(self):
+        thread, client = self.start()
+        self.assertEqual(client.request("list"), ["a/x.txt"])
+        # An update run while the daemon is up
+        record = ("y.txt", "y.txt", 5, 5, "", [], [(".", 5, "", {})], {}, {})
+        Snapshot({"a": [record]}).save(self.root)
+        path = Snapshot.get_path(self.root)
+        os.utime(path, ns=(0, path.stat().st_mtime_ns + 1))
+        self.assertEqual(client.request("list"), ["a/y.txt"])
+        self.assertEqual(client.request("verify"), [["a/y.txt", "missing"]])
+        client.request("shutdown")
+        thread.join(5)
+
+    def test_idle_timeout(self):
+        thread, client = self.start(idle_timeout=0.2)
+        self.assertEqual(client.request("ping"), "pong")
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(DaemonClient.connect(self.socket_path))
+
+
+class EmptySnapshotTestCase(unittest.TestCase):
+    def test_save_refuses_empty(self):
+        with tempfile.TemporaryDirectory() as root:
+            Snapshot({"a": []}).save(root)
+            with self.assertRaisesRegex(ValueError, "empty one"):
+                Snapshot().save(root)
+            self.assertEqual(list(Snapshot.load(root).collections), ["a"])
+            Snapshot().save(root, force=True)
+            self.assertEqual(Snapshot.load(root).collections, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import sys
+import json
+import hashlib
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+TESTDIR = Path(__file__).resolve().parent
+ROOTDIR = TESTDIR.parent
+sys.path.insert(0, str(ROOTDIR))
+from collector.diff import (diff, iter_walk, iter_jsonl, write_jsonl, path_key,
+                            sorted_source, iter_duplicates, open_source, MOVED,
+                            MODIFIED, REMOVED, ADDED)
+from collector.extsort import Spool
+from collector.snapshot import Snapshot
+
+COLLECTOR_PATH = Path(TESTDIR, "fixtures", "collector")
+
+
+class DiffTestCase(unittest.TestCase):
+    def records(self, *records):
+        return sorted(((path, size, bytes.fromhex(digest) if digest else None)
+                       for path, size, digest in records),
+                      key=lambda record: path_key(record[0]))
+
+    def test_diff(self):
+        old = self.records(("a", 1, "01"), ("a/b", 2, "02"), ("c", 3, "03"),
+                           ("d", 4, None), ("e", 5, "05"))
+        new = self.records(("a", 1, "01"), ("a-x", 2, "02"), ("c", 3, "33"),
+                           ("e", 5, "05"), ("f", 6, "06"))
+        changes = [(change.kind, change.path) for change in diff(old, new)]
+        # Moves are only known once both sources are read
+        self.assertEqual(changes, [(MODIFIED, "c"), (REMOVED, "d"),
+                                   (MOVED, "a-x"), (ADDED, "f")])
+
+    def test_many_unmatched(self):
+        digests = [hashlib.sha1(str(n).encode()).digest() for n in range(5000)]
+        old = self.records(*((f"old/{n}", n, digests[n].hex()) for n in range(4000)))
+        new = self.records(*((f"new/{n}", n, digests[n].hex())
+                             for n in range(1000, 5000)))
+        with mock.patch("collector.diff.Spool.flush",
+                        autospec=True, side_effect=Spool.flush) as flush:
+            changes = list(diff(old, new, memory_limit=64 * 1024))
+        # The unmatched records went to disk
+        self.assertGreater(flush.call_count, 2)
+        kinds = {}
+        for change in changes:
+            kinds.setdefault(change.kind, []).append(change)
+        self.assertEqual(len(kinds[REMOVED]), 1000)
+        self.assertEqual(len(kinds[ADDED]), 1000)
+        self.assertEqual(len(kinds[MOVED]), 3000)
+        self.assertTrue(all(change.old[2] == change.new[2] and
+                            change.old[0].split("/")[1] == change.new[0].split("/")[1]
+                            for change in kinds[MOVED]))
+
+    def test_unsorted(self):
+        old = self.records(("a", 1, "01"), ("b", 2, "02"))
+        new = [("b", 2, b"\x02"), ("a", 1, b"\x01")]
+        with self.assertRaisesRegex(ValueError, "new source isn't sorted"):
+            list(diff(old, new))
+        changes = list(diff(old, sorted_source(new)))
+        self.assertEqual(changes, [])
+
+    def test_jsonl(self):
+        records = self.records(("a/b", 2, "02"), ("a-x", 3, None))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "dump.jsonl")
+            write_jsonl(records, path)
+            self.assertEqual(list(iter_jsonl(path)), records)
+            # The digests are kept under their algorithm
+            write_jsonl(records, path, "blake2b")
+            self.assertEqual(list(iter_jsonl(path, "blake2b")), records)
+            self.assertEqual([record[2] for record in iter_jsonl(path)],
+                             [None, None])
+            # Older dumps only had the sha1
+            path.write_text(json.dumps({"path": "a", "size": 1, "sha1": "01"}))
+            self.assertEqual(list(iter_jsonl(path)), [("a", 1, b"\x01")])
+            self.assertEqual(list(iter_jsonl(path, "blake2b")), [("a", 1, None)])
+
+    def test_snapshot_algorithm(self):
+        sha1 = hashlib.sha1(b"hello").hexdigest()
+        blake2b = hashlib.blake2b(b"hello").hexdigest()
+        both = ("a.txt", "a.txt", 5, 5, sha1, [],
+                [(".", 5, sha1, {"sha1": sha1, "blake2b": blake2b})], {}, {})
+        blake2b_only = ("b.txt", "b.txt", 5, 5, None, [],
+                        [(".", 5, None, {"blake2b": blake2b})], {}, {})
+        sha1_only = ("c.txt", "c.txt", 5, 5, sha1, [],
+                     [(".", 5, sha1, {})], {}, {})
+        with tempfile.TemporaryDirectory() as root:
+            Snapshot({"docs": [both, blake2b_only, sha1_only]}).save(root)
+            path = Snapshot.get_path(root)
+            self.assertEqual(list(open_source(path, "blake2b")),
+                             [("docs/a.txt", 5, bytes.fromhex(blake2b)),
+                              ("docs/b.txt", 5, bytes.fromhex(blake2b)),
+                              ("docs/c.txt", 5, None)])
+            self.assertEqual(list(open_source(path)),
+                             [("docs/a.txt", 5, bytes.fromhex(sha1)),
+                              ("docs/b.txt", 5, None),
+                              ("docs/c.txt", 5, bytes.fromhex(sha1))])
+            # Without blake2b digests only the sizes are compared
+            walked = [("docs/a.txt", 5, bytes.fromhex(blake2b)),
+                      ("docs/b.txt", 5, bytes.fromhex(blake2b)),
+                      ("docs/c.txt", 5, bytes.fromhex(blake2b))]
+            self.assertEqual(list(diff(open_source(path, "blake2b"), walked)), [])
+
+    def test_duplicates(self):
+        records = self.records(("a", 1, "01"), ("b", 1, "01"), ("c", 1, "02"),
+                               ("d", 1, None), ("e", 1, None))
+        groups = [[record[0] for record in group]
+                  for group in iter_duplicates(records)]
+        self.assertEqual(groups, [["a", "b"]])
+
+    def test_walk_order(self):
+        paths = [record[0] for record in iter_walk(COLLECTOR_PATH)]
+        self.assertEqual(paths, sorted(paths, key=path_key))
+        self.assertEqual(len(paths), 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
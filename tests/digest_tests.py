@@ -0,0 +1,95 @@
+import os
+import sys
+import hashlib
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from helpers import CollectorTreeTestCase
+from collector.digest import get_digests_file, get_hasher, digest_bytes
+from collector.file import File, DirectoryItemFile
+from collector.item import FileItem, DirectoryItem
+from collector.snapshot import Snapshot, DIGESTS, SHA1
+
+
+class DigestsFileTestCase(unittest.TestCase):
+    def test_single_read(self):
+        data = os.urandom(10000)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            reads = []
+            digests = get_digests_file(f.name, ("sha1", "sha256", "blake2b"),
+                                       buffer_size=4096,
+                                       throttle=lambda n, latency: reads.append(n))
+        self.assertEqual(digests, {"sha1": hashlib.sha1(data).hexdigest(),
+                                   "sha256": hashlib.sha256(data).hexdigest(),
+                                   "blake2b": hashlib.blake2b(data).hexdigest()})
+        # Every byte read once for all the algorithms
+        self.assertEqual(reads, [4096, 4096, 1808])
+
+    def test_unknown_algorithm(self):
+        with self.assertRaisesRegex(ValueError, "md4"):
+            get_hasher("md4")
+
+    def test_digest_bytes(self):
+        self.assertEqual(digest_bytes("00ff"), b"\x00\xff")
+        self.assertIsNone(digest_bytes(""))
+        self.assertIsNone(digest_bytes(None))
+
+
+class ItemDigestTestCase(unittest.TestCase):
+    def directory_file(self, relative_path, data):
+        digests = {"sha1": hashlib.sha1(data).hexdigest(),
+                   "blake2b": hashlib.blake2b(data).hexdigest()}
+        return (DirectoryItemFile.Builder(DirectoryItemFile)
+                .set_path(Path("/record", relative_path))
+                .set_relative_path(relative_path)
+                .set_size(len(data)).set_digests(digests).build())
+
+    def test_directory_digest(self):
+        files = [self.directory_file("b.mp3", b"two"),
+                 self.directory_file("a.mp3", b"one")]
+        item = DirectoryItem(files, "record", None, Path("/record"), "record", 6)
+        item.update_digests(("sha1", "blake2b"))
+        table = (f"{hashlib.sha1(b'one').hexdigest()} a.mp3\n"
+                 f"{hashlib.sha1(b'two').hexdigest()} b.mp3")
+        self.assertEqual(item.sha1_table, table)
+        self.assertEqual(item.sha1, hashlib.sha1(table.encode()).hexdigest())
+        blake2b_table = (f"{hashlib.blake2b(b'one').hexdigest()} a.mp3\n"
+                         f"{hashlib.blake2b(b'two').hexdigest()} b.mp3")
+        self.assertEqual(item.get_digest("blake2b"),
+                         hashlib.blake2b(blake2b_table.encode()).hexdigest())
+
+    def test_file_item_digest(self):
+        file = File(Path("a.txt"), 3, digests={"blake2b": "ab"})
+        item = FileItem(file, "a.txt", None, Path("a.txt"), "a.txt", 3)
+        self.assertEqual(item.get_digest("blake2b"), "ab")
+        self.assertEqual(item.get_digests(), {"blake2b": "ab"})
+        self.assertIsNone(item.get_digest())
+
+
+class SnapshotDigestsTestCase(CollectorTreeTestCase):
+    collections = {"docs": {"type": "files", "path": "Docs",
+                            "digest": ["blake2b", "sha1"]},
+                   "albums": {"type": "directories", "path": "Albums",
+                              "digest": ["sha1", "blake2b"]}}
+    files = {"Docs/a.txt": "hello", "Albums/record1/t1": "one"}
+
+    def test_item_digests(self):
+        snapshot = Snapshot.from_collector(self.build())
+        records = dict(snapshot.iter_items())
+        self.assertEqual(records["Docs"][DIGESTS],
+                         {"sha1": hashlib.sha1(b"hello").hexdigest(),
+                          "blake2b": hashlib.blake2b(b"hello").hexdigest()})
+        record = records["Albums"]
+        self.assertEqual(sorted(record[DIGESTS]), ["blake2b", "sha1"])
+        self.assertEqual(record[DIGESTS]["sha1"], record[SHA1])
+        table = f"{hashlib.blake2b(b'one').hexdigest()} t1"
+        self.assertEqual(record[DIGESTS]["blake2b"],
+                         hashlib.blake2b(table.encode()).hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+import sys
+import time
+import socket
+import hashlib
+import threading
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from helpers import CollectorTreeTestCase, DOCS
+from collector.file import File
+from collector.distributed import Coordinator, TASKS, main
+
+# Reads a lease and exits without answering
+DYING_WORKER = [sys.executable, "-c", "import sys; sys.stdin.readline()"]
+# Reads a lease and never answers
+HUNG_WORKER = [sys.executable, "-c",
+               "import sys, time; sys.stdin.readline(); time.sleep(60)"]
+
+
+class FlakyCoordinator(Coordinator):
+    "Its first workers die, or hang"
+
+    def __init__(self, *args, deaths=1, broken_worker=DYING_WORKER, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deaths = deaths
+        self.broken_worker = broken_worker
+
+    def worker_command(self):
+        with self.condition:
+            self.deaths -= 1
+            if self.deaths >= 0:
+                return self.broken_worker
+        return super().worker_command()
+
+
+class CoordinatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.root = Path(self.tmpdir.name)
+        self.data = {}
+        self.files = []
+        for n in range(10):
+            path = Path(self.root, f"dir{n % 3}", f"file{n}")
+            path.parent.mkdir(exist_ok=True)
+            data = f"content {n}".encode()
+            path.write_bytes(data)
+            self.data[path] = data
+            self.files.append(File(path, len(data)))
+        self.collection = mock.Mock(path=self.root,
+                                    digest_algorithms=("sha1", "blake2b"))
+        self.collection.iter_files.side_effect = lambda: iter(self.files)
+
+    def assertHashed(self, files):
+        for file in files:
+            data = self.data[file.path]
+            self.assertEqual(file.sha1, hashlib.sha1(data).hexdigest())
+            self.assertEqual(file.get_digest("blake2b"),
+                             hashlib.blake2b(data).hexdigest())
+
+    def test_run_local(self):
+        coordinator = Coordinator(self.collection, chunk_size=3)
+        self.assertEqual(len(coordinator.pending), 4)
+        self.assertEqual(coordinator.run_local(2), [])
+        self.assertTrue(coordinator.done)
+        self.assertHashed(self.files)
+
+    def test_files(self):
+        coordinator = Coordinator(self.collection, files=self.files[:4],
+                                  chunk_size=2)
+        self.assertEqual(coordinator.run_local(2), [])
+        self.assertHashed(self.files[:4])
+        self.assertIsNone(self.files[4].sha1)
+
+    def test_dead_workers_respawn(self):
+        coordinator = FlakyCoordinator(self.collection, chunk_size=3, deaths=2)
+        self.assertEqual(coordinator.run_local(2), [])
+        self.assertHashed(self.files)
+
+    def test_all_workers_die(self):
+        coordinator = FlakyCoordinator(self.collection, chunk_size=5,
+                                       max_attempts=2, deaths=1000)
+        failed = coordinator.run_local(2)
+        self.assertEqual(sorted(lease.id for lease in failed), [0, 1])
+        self.assertTrue(all(lease.attempts == 2 for lease in failed))
+        self.assertTrue(all(file.sha1 is None for file in self.files))
+
+    def test_hung_workers(self):
+        coordinator = FlakyCoordinator(self.collection, chunk_size=5,
+                                       deaths=1, broken_worker=HUNG_WORKER,
+                                       lease_timeout=1)
+        start = time.monotonic()
+        with self.assertLogs("collector.command", "WARNING"):
+            self.assertEqual(coordinator.run_local(1), [])
+        # The hung worker was killed instead of waited for
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertHashed(self.files)
+
+    def test_hung_remote_worker(self):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        coordinator = Coordinator(self.collection, chunk_size=5, lease_timeout=1)
+        failed = []
+        server = threading.Thread(
+            target=lambda: failed.extend(coordinator.serve("127.0.0.1", port)))
+        with self.assertLogs("collector.command", "WARNING"):
+            server.start()
+            for _ in range(100):
+                try:
+                    hung = socket.create_connection(("127.0.0.1", port))
+                    break
+                except ConnectionRefusedError:
+                    time.sleep(0.05)
+            with hung, hung.makefile("rb") as rfile:
+                self.assertIn(b'"lease": 0', rfile.readline())
+                # The connection is shut down when the lease expires
+                self.assertEqual(rfile.readline(), b"")
+            main(["worker", str(self.root), "--connect", f"127.0.0.1:{port}"])
+            server.join(10)
+        self.assertFalse(server.is_alive())
+        self.assertEqual(failed, [])
+        self.assertHashed(self.files)
+
+    def test_unfinished(self):
+        coordinator = Coordinator(self.collection, chunk_size=3)
+        with mock.patch.object(coordinator, "next_lease", return_value=None):
+            with self.assertRaisesRegex(RuntimeError, "4 chunks were left unfinished"):
+                coordinator.run_local(2)
+
+    def test_thumbnail_task(self):
+        self.assertIn("thumbnail", TASKS)
+        files = [mock.Mock(path=Path(self.root, "a.jpg"))]
+        coordinator = Coordinator(self.collection, task="thumbnail",
+                                  args={"thumbnail_path": ".thumbnails"},
+                                  files=files)
+        lease = coordinator.next_lease()
+        self.assertIn('"args": {"thumbnail_path": ".thumbnails"}',
+                      coordinator.request(lease))
+        coordinator.complete({"lease": lease.id, "results": {"a.jpg": 42}})
+        files[0].set_phash.assert_called_once_with(42)
+        self.assertTrue(coordinator.done)
+
+
+class DistributedSettingsTestCase(CollectorTreeTestCase):
+    collections = {"docs": dict(DOCS, distributed={"workers": 2}),
+                   "notes": {"type": "files", "path": "Notes"}}
+    files = {"Docs/a.txt": "hello", "Notes/b.txt": "world"}
+
+    def test_build(self):
+        with mock.patch.object(Coordinator, "run_local", autospec=True,
+                               side_effect=Coordinator.run_local) as run_local:
+            docs, notes = self.build().collections
+        # Only the collection with the setting is hashed by the workers
+        (coordinator, workers), = [call.args for call in run_local.call_args_list]
+        self.assertEqual(workers, 2)
+        self.assertEqual(list(coordinator.files), ["a.txt"])
+        self.assertEqual(docs.items[0].file.sha1, hashlib.sha1(b"hello").hexdigest())
+        self.assertEqual(notes.items[0].file.sha1, hashlib.sha1(b"world").hexdigest())
+        # A build can be distributed regardless of the settings
+        with mock.patch.object(Coordinator, "run_local", autospec=True,
+                               side_effect=Coordinator.run_local) as run_local:
+            self.build(distributed=(1, None), resume=False)
+        self.assertEqual([call.args[1] for call in run_local.call_args_list], [1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
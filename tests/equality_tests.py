@@ -0,0 +1,104 @@
+import sys
+import hashlib
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from helpers import CollectorTreeTestCase, DOCS, ALBUMS
+from collector.collection import FileCollection
+from collector.file import File
+from collector.item import FileItem
+
+
+class Blake2bCollection(FileCollection):
+    relative_path = "docs"
+    digest_algorithms = ("blake2b",)
+
+
+class KeyTestCase(unittest.TestCase):
+    def setUp(self):
+        collector = type("Collector", (), {"path": Path("/master")})()
+        self.collection = Blake2bCollection([], collector)
+
+    def file_item(self, data, digests=None):
+        file = File(Path("/master/docs/a.txt"), len(data), digests=digests)
+        item = FileItem(file, "a.txt", None, None, Path("a.txt"), len(data))
+        item.set_collection(self.collection)
+        file.set_item(item)
+        return item
+
+    def test_set_membership(self):
+        a = File(Path("a.txt"), 5, sha1=hashlib.sha1(b"hello").hexdigest())
+        a2 = File(Path("a.txt"), 5, sha1=hashlib.sha1(b"hello").hexdigest())
+        b = File(Path("a.txt"), 5, sha1=hashlib.sha1(b"world").hexdigest())
+        self.assertEqual(a, a2)
+        self.assertNotEqual(a, b)
+        self.assertEqual(len({a, a2, b}), 2)
+        self.assertIn(a2, {a})
+
+    def test_key_after_hashing(self):
+        item = self.file_item("hello")
+        self.assertEqual(item.key, ("a.txt", 5, None))
+        self.assertEqual(item.file.key, ("a.txt", 5, None))
+        digest = hashlib.blake2b(b"hello").hexdigest()
+        item.file.set_digests({"blake2b": digest})
+        self.assertEqual(item.key, ("a.txt", 5, bytes.fromhex(digest)))
+        self.assertEqual(item.file.key, ("a.txt", 5, bytes.fromhex(digest)))
+
+    def test_primary_digest(self):
+        # Only blake2b is computed in this collection
+        hello = self.file_item("hello", {"blake2b": hashlib.blake2b(b"hello").hexdigest()})
+        world = self.file_item("world", {"blake2b": hashlib.blake2b(b"world").hexdigest()})
+        self.assertNotEqual(hello, world)
+        self.assertNotEqual(hello.file, world.file)
+        self.assertEqual(len({hello, world}), 2)
+
+
+class ReconcileTestCase(CollectorTreeTestCase):
+    collections = {"docs": dict(DOCS, digest=["blake2b"]), "albums": ALBUMS}
+    files = {"Docs/a.txt": "hello", "Docs/b.txt": "world",
+             "Albums/r1/t1": "one", "Albums/r1/t2": "two"}
+
+    def test_reconcile(self):
+        old_docs, old_albums = self.build().collections
+        self.write_files({"Docs/b.txt": "WORLD", "Docs/c.txt": "new",
+                          "Albums/r1/t2": "TWO"})
+        new_docs, new_albums = self.build().collections
+
+        added, removed, common = old_docs.reconcile_items(new_docs)
+        self.assertEqual([str(item.relative_path) for item in added],
+                         ["b.txt", "c.txt"])
+        self.assertEqual([str(item.relative_path) for item in removed], ["b.txt"])
+        self.assertEqual([str(item.relative_path) for item in common], ["a.txt"])
+        self.assertIs(common[0], new_docs.items[0])
+
+        added, removed, common = old_albums.reconcile_items(new_albums)
+        self.assertEqual((len(added), len(removed), len(common)), (1, 1, 0))
+
+        added, removed, common = old_docs.reconcile_files(new_docs)
+        self.assertEqual([file.key[0] for file in added], ["b.txt", "c.txt"])
+        self.assertEqual([file.key[0] for file in common], ["a.txt"])
+
+        added, removed, common = old_albums.reconcile_files(new_albums)
+        self.assertEqual([file.relative_path_string for file in added], ["t2"])
+        self.assertEqual([file.relative_path_string for file in removed], ["t2"])
+        self.assertEqual([file.relative_path_string for file in common], ["t1"])
+
+
+class SameContentTestCase(CollectorTreeTestCase):
+    files = {"Docs/a.txt": "hello", "Docs/b.txt": "hello",
+             "Albums/r1/t1": "one", "Albums/r2/t1": "one"}
+    collections = {"docs": DOCS, "albums": ALBUMS}
+
+    def test_distinct_files(self):
+        docs, albums = self.build().collections
+        a, b = docs.iter_files()
+        self.assertNotEqual(a, b)
+        self.assertEqual(len(set(docs.iter_files())), 2)
+        self.assertEqual(sorted(file.key[0] for file in albums.iter_files()),
+                         ["r1/t1", "r2/t1"])
+        self.assertEqual(len(set(albums.iter_files())), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import sys
+import hashlib
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from helpers import mock_item
+from collector import command
+from collector.command import INFO_PATH, dump
+from collector.diff import iter_manifest, iter_manifest_entries, open_source
+from collector.extsort import external_sort, Spool
+from collector.file import File
+from collector.snapshot import Snapshot
+from collector.volume import Volume
+from collector.writer import VolumeWriter
+
+
+class ExternalSortTestCase(unittest.TestCase):
+    def test_in_memory(self):
+        self.assertEqual(list(external_sort([3, 1, 2])), [1, 2, 3])
+        self.assertEqual(list(external_sort([])), [])
+
+    def test_spilled_runs(self):
+        records = [(str((n * 7919) % 10007), n) for n in range(20000)]
+        result = list(external_sort(records, key=lambda record: record[0],
+                                    memory_limit=64 * 1024))
+        self.assertEqual(result, sorted(records, key=lambda record: record[0]))
+
+    def test_spool(self):
+        spool = Spool()
+        for n in range(3000):
+            spool.append(n)
+        self.assertIsNotNone(spool.file)
+        self.assertLess(len(spool.buffer), 3000)
+        self.assertEqual(list(spool), list(range(3000)))
+        spool = Spool()
+        spool.append(1)
+        self.assertEqual(list(spool), [1])
+        self.assertIsNone(spool.file)
+
+
+class ManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.root = Path(self.tmpdir.name)
+
+    def test_write_manifest(self):
+        master = Path(self.root, "master")
+        files = []
+        for n in range(600):
+            data = str(n).encode()
+            path = Path(master, f"dir{n % 7}", f"file{n}")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            files.append(File(path, len(data), sha1=hashlib.sha1(data).hexdigest()))
+        writer = VolumeWriter(Volume(1, [mock_item(*files)]), master,
+                              Path(self.root, "target"))
+        writer.write_manifest()
+        manifest_path = Path(self.root, "target", INFO_PATH)
+        records = list(iter_manifest(manifest_path))
+        expected = sorted((f"dir{n % 7}/file{n}", len(str(n)),
+                           hashlib.sha1(str(n).encode()).digest())
+                          for n in range(600))
+        self.assertEqual(sorted(records), expected)
+        # The entries are parsed a batch at a time
+        with mock.patch.object(command, "load", wraps=command.load) as load:
+            entries = list(iter_manifest_entries(manifest_path, batch_size=100))
+        self.assertEqual(len(entries), 600)
+        self.assertEqual(load.call_count, 6)
+
+    def test_other_layouts(self):
+        path = Path(self.root, "manifest.yml")
+        entries = [{"path": "a", "size": 1, "sha1": "00"},
+                   {"path": "b", "size": 2, "sha1": None}]
+        # Keys sorted, the files list comes before the volume
+        with open(path, "w") as f:
+            dump({"files": entries, "volume": 3}, f)
+        self.assertEqual(list(iter_manifest(path)),
+                         [("a", 1, b"\x00"), ("b", 2, None)])
+        path.write_text("volume: 3\nfiles:\n  - path: a\n    size: 1\n")
+        self.assertEqual(list(iter_manifest(path)), [("a", 1, None)])
+        path.write_text("volume: 3\nfiles: []\n")
+        self.assertEqual(list(iter_manifest(path)), [])
+
+
+class SnapshotSourceTestCase(unittest.TestCase):
+    def test_large_snapshot(self):
+        with tempfile.TemporaryDirectory() as root:
+            record = ("x.txt", "x.txt", 5, 5, "00", [], [(".", 5, "00", {})], {}, {})
+            Snapshot({"a": [record]}).save(root)
+            path = Snapshot.get_path(root)
+            with self.assertLogs("collector.command", "WARNING"):
+                records = list(open_source(path, memory_limit=10))
+        self.assertEqual(records, [("a/x.txt", 5, b"\x00")])
+
+
+if __name__ == "__main__":
+    unittest.main()
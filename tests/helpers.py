@@ -0,0 +1,74 @@
+"""Fixtures shared by the tests: a collector tree in a temporary directory
+with its settings file, and the helpers to fill and build it."""
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+TESTDIR = Path(__file__).resolve().parent
+ROOTDIR = TESTDIR.parent
+sys.path.insert(0, str(ROOTDIR))
+from collector.command import COLLECTION_SETTINGS, get_yaml
+from collector.collector import Collector
+
+DOCS = {"type": "files", "path": "Docs"}
+ALBUMS = {"type": "directories", "path": "Albums"}
+
+
+def write(path, content):
+    "Writes text or bytes to path creating its directories"
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if isinstance(content, bytes):
+        path.write_bytes(content)
+    else:
+        path.write_text(content)
+
+
+def mock_item(*files):
+    "An item of the files for the volume writers"
+    item = mock.Mock()
+    item.iter_files.side_effect = lambda: iter(files)
+    return item
+
+
+def write_settings(root, collections, **settings):
+    "Writes the settings file of the collector at root, in the given order"
+    yaml, _, YDumper = get_yaml()
+    settings["collections"] = collections
+    with open(Path(root, COLLECTION_SETTINGS), "w", encoding="utf-8") as f:
+        yaml.dump(settings, f, Dumper=YDumper, sort_keys=False)
+
+
+def build(root, **kwargs):
+    "Returns the collector at root with its collections built"
+    collector = Collector(root)
+    try:
+        collector.build(**kwargs)
+    finally:
+        collector.close()
+    return collector
+
+
+class CollectorTreeTestCase(unittest.TestCase):
+    """A collector in a temporary directory, self.root, with the collections
+    and other settings and the files, relative path: content, of the class"""
+
+    collections = {"docs": DOCS}
+    settings = {}
+    files = {}
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.root = Path(self.tmpdir.name)
+        write_settings(self.root, self.collections, **self.settings)
+        self.write_files(self.files)
+
+    def write_files(self, files):
+        for relative_path, content in files.items():
+            write(Path(self.root, relative_path), content)
+
+    def build(self, **kwargs):
+        return build(self.root, **kwargs)
@@ -0,0 +1,179 @@
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from helpers import CollectorTreeTestCase
+from collector.snapshot import Snapshot
+from collector.distributed import Coordinator
+from collector.perceptual import (find_clusters, hamming, MultiIndexHash,
+                                  compute_thumbnail_and_dhash)
+from collector.collections.images import (ImageItem, ImageFile, ImageCollection,
+                                          ImageCollectionFileSystemInitializer)
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+def gradient(size, reverse=False):
+    "A horizontal gradient, reversed ones have the opposite dhash"
+    image = Image.new("L", size)
+    width, height = size
+    for x in range(width):
+        value = 255 - x * 255 // width if reverse else x * 255 // width
+        for y in range(height):
+            image.putpixel((x, y), value)
+    return image
+
+
+class NearDuplicatesTestCase(unittest.TestCase):
+    def test_hamming(self):
+        self.assertEqual(hamming(0b1010, 0b0110), 2)
+        self.assertEqual(hamming(1 << 63, 0), 1)
+
+    def test_index(self):
+        index = MultiIndexHash(threshold=2)
+        index.add(0b1111, "a")
+        index.add(0b1111 << 40, "b")
+        self.assertEqual(index.query(0b1100), {"a"})
+        self.assertEqual(index.query(0b1000), set())
+
+    def test_clusters(self):
+        hashes = {"a": 0xF0F0F0F0F0F0F0F0, "b": 0xF0F0F0F0F0F0F0F1,
+                  "c": 0xF0F0F0F0F0F0F0F1, "d": 0x0F0F0F0F0F0F0F0F,
+                  "e": 0x0F0F0F0F0F0F0F0F ^ (0b111 << 30), "f": 0}
+        clusters = sorted(sorted(cluster) for cluster in find_clusters(hashes, 3))
+        self.assertEqual(clusters, [["a", "b", "c"], ["d", "e"]])
+
+
+class Photos(ImageCollection):
+    relative_path = "Photos"
+
+
+class ImageCollectionTestCase(unittest.TestCase):
+    def build_item(self, name, phash=None):
+        builder = ImageItem.Builder()
+        builder.set_name(name).set_relative_path(name).set_size(10).set_phash(phash)
+        builder.set_file(ImageFile(Path("/photos", name), 10))
+        return builder.build()
+
+    def test_builder(self):
+        item = self.build_item("a.jpg", phash=42)
+        self.assertIsInstance(item, ImageItem)
+        self.assertEqual(item.file.path, Path("/photos/a.jpg"))
+        self.assertEqual(item.get_extras(), {"phash": 42})
+        self.assertEqual(list(item.iter_files()), [item.file])
+
+    def test_find_near_duplicates(self):
+        items = [self.build_item("a.jpg", 0xFF), self.build_item("b.jpg", 0xFE),
+                 self.build_item("c.jpg", 0xFF << 32), self.build_item("d.jpg")]
+        collector = type("Collector", (), {"path": Path("/master")})()
+        collection = Photos(items, collector)
+        duplicates = collection.find_near_duplicates(threshold=2)
+        self.assertEqual([sorted(item.name for item in cluster)
+                          for cluster in duplicates], [["a.jpg", "b.jpg"]])
+
+    def test_thumbnail_path(self):
+        collector = type("Collector", (), {"path": Path("/master")})()
+        collection = Photos([], collector)
+        paths = [collection.get_thumbnail_path(self.build_item(name))
+                 for name in ("a.jpg", "a.png")]
+        self.assertEqual(paths, [Path("/master/Photos/.thumbnails/a.jpg.jpg"),
+                                 Path("/master/Photos/.thumbnails/a.png.jpg")])
+
+    def test_item_paths(self):
+        self.assertIs(ImageCollection.constructor_class,
+                      ImageCollectionFileSystemInitializer)
+        with tempfile.TemporaryDirectory() as root:
+            for name in ("b.PNG", "a.jpg", "notes.txt", ".hidden.jpg"):
+                Path(root, name).touch()
+            Path(root, ".thumbnails").mkdir()
+            paths = ImageCollection.collections_item_path_iterator(root)
+            self.assertEqual([path.name for path in paths], ["a.jpg", "b.PNG"])
+
+
+class KnownPhashesTestCase(CollectorTreeTestCase):
+    collections = {"photos": {"type": "images", "path": "Photos",
+                              "digest": ["blake2b"], "workers": 1}}
+    files = {"Photos/a.png": "a", "Photos/b.png": "b"}
+
+    def make_thumbnail(self, file, thumbnail_path, made):
+        made.append(file.path.name)
+        thumbnail_path.parent.mkdir(parents=True, exist_ok=True)
+        thumbnail_path.touch()
+        file.set_phash(len(made))
+
+    def fake_thumbnails(self, made):
+        def compute_thumbnail(file, pool, thumbnail_path):
+            self.make_thumbnail(file, thumbnail_path, made)
+            return mock.Mock()
+
+        return mock.patch.object(ImageFile, "compute_thumbnail", compute_thumbnail)
+
+    def build_photos(self):
+        "Builds the photos faking their thumbnails, returns the ones made"
+        made = []
+        with self.fake_thumbnails(made):
+            collector = self.build()
+        Snapshot.from_collector(collector).save(self.root)
+        return sorted(made)
+
+    def test_known_phashes(self):
+        self.assertEqual(self.build_photos(), ["a.png", "b.png"])
+        # Only the changed image is decoded again, keyed by its blake2b
+        self.write_files({"Photos/b.png": "c"})
+        self.assertEqual(self.build_photos(), ["b.png"])
+        self.assertEqual(self.build_photos(), [])
+
+
+class DistributedKnownPhashesTestCase(KnownPhashesTestCase):
+    collections = {"photos": {"type": "images", "path": "Photos",
+                              "digest": ["blake2b"], "distributed": {"workers": 1}}}
+
+    def fake_thumbnails(self, made):
+        "The thumbnail leases are made in place, the digest ones by workers"
+        run_local = Coordinator.run_local
+
+        def fake_run_local(coordinator, workers=None):
+            if coordinator.task != "thumbnail":
+                return run_local(coordinator, workers)
+            for file in coordinator.files.values():
+                self.make_thumbnail(file, Path(coordinator.root, ".thumbnails",
+                                               file.path.name + ".jpg"), made)
+            return []
+
+        return mock.patch.object(Coordinator, "run_local", fake_run_local)
+
+
+@unittest.skipUnless(Image, "Pillow isn't installed")
+class ThumbnailTestCase(CollectorTreeTestCase):
+    collections = {"photos": {"type": "images", "path": "Photos"}}
+
+    def test_compute_thumbnail_and_dhash(self):
+        gradient((600, 400)).save(Path(self.root, "big.png"))
+        gradient((90, 60)).save(Path(self.root, "small.jpg"))
+        gradient((600, 400), reverse=True).save(Path(self.root, "reverse.png"))
+        hashes = {}
+        for name in ("big.png", "small.jpg", "reverse.png"):
+            thumbnail_path = Path(self.root, name + ".thumb.jpg")
+            hashes[name] = compute_thumbnail_and_dhash(Path(self.root, name),
+                                                       thumbnail_path, size=(64, 64))
+            with Image.open(thumbnail_path) as thumbnail:
+                self.assertLessEqual(max(thumbnail.size), 64)
+        self.assertLessEqual(hamming(hashes["big.png"], hashes["small.jpg"]), 4)
+        self.assertGreater(hamming(hashes["big.png"], hashes["reverse.png"]), 32)
+
+    def test_build(self):
+        Path(self.root, "Photos").mkdir()
+        gradient((120, 80)).save(Path(self.root, "Photos", "a.png"))
+        photos, = self.build().collections
+        item, = photos.items
+        self.assertIsNotNone(item.phash)
+        self.assertTrue(photos.get_thumbnail_path(item).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
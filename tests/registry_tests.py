@@ -0,0 +1,136 @@
+import sys
+import hashlib
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+from importlib.metadata import EntryPoint
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from helpers import CollectorTreeTestCase, DOCS, write
+from collector.collector import Collector
+from collector.collection import FileCollection, DirectoryCollection
+from collector.registry import CollectionRegistry, CollectionSettings, ENTRY_POINT_GROUP
+
+NOTES_MODULE = """
+from collector.collection import FileCollection
+
+class NotesCollection(FileCollection):
+    pass
+"""
+
+
+class CollectionSettingsTestCase(unittest.TestCase):
+    def test_defaults(self):
+        settings = CollectionSettings("photos", {"digest": "blake2b"})
+        self.assertEqual(settings.type, "directories")
+        self.assertEqual(settings.path, "photos")
+        self.assertEqual(settings.digest, ["blake2b"])
+        self.assertEqual(settings.cache, "snapshot")
+
+    def test_unknown_key(self):
+        with self.assertRaisesRegex(ValueError, "colour"):
+            CollectionSettings("photos", {"colour": "red"})
+
+    def test_distributed(self):
+        self.assertIsNone(CollectionSettings("photos").get_distributed())
+        settings = CollectionSettings(
+            "photos", {"distributed": {"workers": 4, "address": "0.0.0.0:7077"}})
+        self.assertEqual(settings.get_distributed(), (4, ("0.0.0.0", 7077)))
+        settings = CollectionSettings("photos", {"distributed": {}})
+        self.assertEqual(settings.get_distributed(), (None, None))
+        for distributed in ({"hosts": 2}, {"address": "7077"}, True):
+            with self.assertRaisesRegex(ValueError, "distributed"):
+                CollectionSettings("photos", {"distributed": distributed})
+
+
+class CollectionRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        write(Path(self.tmpdir.name, "lazy_notes.py"), NOTES_MODULE)
+        sys.path.insert(0, self.tmpdir.name)
+        self.addCleanup(sys.path.remove, self.tmpdir.name)
+        self.addCleanup(sys.modules.pop, "lazy_notes", None)
+
+    def test_lazy_import(self):
+        registry = CollectionRegistry()
+        registry.register("notes", "lazy_notes:NotesCollection")
+        self.assertIn("notes", registry)
+        self.assertNotIn("lazy_notes", sys.modules)
+        cls = registry.get("notes")
+        self.assertEqual(cls.__name__, "NotesCollection")
+        self.assertIn("lazy_notes", sys.modules)
+        self.assertIs(registry.get("notes"), cls)
+
+    def test_builtin_types(self):
+        registry = CollectionRegistry()
+        with mock.patch("importlib.metadata.entry_points") as entry_points:
+            self.assertIs(registry.get("files"), FileCollection)
+            self.assertIs(registry.get("directories"), DirectoryCollection)
+        entry_points.assert_not_called()
+
+    def test_entry_point_fallback(self):
+        registry = CollectionRegistry()
+        entry_point = EntryPoint("plugin", "lazy_notes:NotesCollection",
+                                 ENTRY_POINT_GROUP)
+        with mock.patch("importlib.metadata.entry_points",
+                        return_value=[entry_point]) as entry_points:
+            self.assertEqual(registry.get("plugin").__name__, "NotesCollection")
+            with self.assertRaisesRegex(ValueError, "Unknown collection type"):
+                registry.get("missing")
+        # Entry points are only scanned once
+        entry_points.assert_called_once_with(group=ENTRY_POINT_GROUP)
+
+
+class CollectorSettingsTestCase(CollectorTreeTestCase):
+    collections = {"docs": DOCS,
+                   "albums": {"type": "directories", "path": "Albums",
+                              "digest": ["sha1", "blake2b"]},
+                   "notes": {"type": "notes"}}
+    settings = {"types": {"notes": "lazy_notes:NotesCollection"}}
+    files = {"lazy_notes.py": NOTES_MODULE,
+             "Docs/a.txt": "hello", "Docs/.hidden": "skipped",
+             "Albums/record1/track1.mp3": "one",
+             "Albums/record1/cd2/track2.mp3": "two",
+             "notes/n.txt": "note"}
+
+    def setUp(self):
+        super().setUp()
+        sys.path.insert(0, self.tmpdir.name)
+        self.addCleanup(sys.path.remove, self.tmpdir.name)
+        self.addCleanup(sys.modules.pop, "lazy_notes", None)
+        self.collector = Collector(self.root)
+        self.addCleanup(self.collector.close)
+
+    def test_collection_class(self):
+        cls = self.collector.get_collection_class("albums")
+        self.assertTrue(issubclass(cls, DirectoryCollection))
+        self.assertEqual(cls.relative_path, "Albums")
+        self.assertEqual(cls.digest_algorithms, ("sha1", "blake2b"))
+        self.assertEqual(cls.settings.name, "albums")
+        self.assertIs(self.collector.get_collection_class("albums"), cls)
+        with self.assertRaisesRegex(ValueError, "no collection 'nope'"):
+            self.collector.get_collection_class("nope")
+
+    def test_build(self):
+        collections = self.collector.build()
+        self.assertEqual([collection.settings.name for collection in collections],
+                         ["docs", "albums", "notes"])
+        docs, albums, notes = collections
+        self.assertIs(type(albums), self.collector.get_collection_class("albums"))
+        self.assertEqual(type(notes).__mro__[1].__name__, "NotesCollection")
+        self.assertEqual(albums.path, Path(self.tmpdir.name, "Albums"))
+        self.assertEqual([str(item.relative_path) for item in docs.iter_items()],
+                         ["a.txt"])
+        record = albums.items[0]
+        self.assertEqual(record.size, 6)
+        files = {file.relative_path_string: file for file in record.iter_files()}
+        self.assertEqual(sorted(files), ["cd2/track2.mp3", "track1.mp3"])
+        self.assertEqual(files["track1.mp3"].get_digest("blake2b"),
+                         hashlib.blake2b(b"one").hexdigest())
+        self.assertEqual(docs.items[0].file.sha1, hashlib.sha1(b"hello").hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import sys
+import time
+import random
+import unittest
+from unittest import mock
+from pathlib import Path
+from itertools import combinations
+
+TESTDIR = Path(__file__).resolve().parent
+ROOTDIR = TESTDIR.parent
+sys.path.insert(0, str(ROOTDIR))
+from collector.restore import RestorePlanner, under_replicated
+
+
+def mock_item(relative_path, volumes, size=1, value=5):
+    item = mock.Mock()
+    item.relative_path = relative_path
+    item.volumes = volumes
+    item.size = size
+    item.value = value
+    return item
+
+
+def random_items(count, volumes, copies, seed):
+    rnd = random.Random(seed)
+    return [mock_item(str(n), rnd.sample(range(volumes), copies))
+            for n in range(count)]
+
+
+def minimum_cover(items):
+    volumes = sorted(set(volume for item in items for volume in item.volumes))
+    for size in range(1, len(volumes) + 1):
+        for chosen in combinations(volumes, size):
+            if all(set(item.volumes) & set(chosen) for item in items):
+                return size
+
+
+class RestorePlannerTestCase(unittest.TestCase):
+    def assertCovers(self, plan, items):
+        read = [item for _, volume_items in plan.reads for item in volume_items]
+        self.assertEqual(sorted(read, key=id), sorted(items, key=id))
+        for volume, volume_items in plan.reads:
+            self.assertTrue(all(volume in item.volumes for item in volume_items))
+
+    def test_fewest_volumes(self):
+        items = [mock_item("a", [1, 2, 5]), mock_item("b", [2, 3, 5]),
+                 mock_item("c", [3, 4]), mock_item("d", [1, 4])]
+        plan = RestorePlanner(items).plan()
+        self.assertEqual(plan.swaps, 2)
+        self.assertEqual([volume for volume, _ in plan.reads], [1, 3])
+        paths = [[item.relative_path for item in items] for _, items in plan.reads]
+        self.assertEqual(paths, [["a", "d"], ["b", "c"]])
+
+    def test_forced_and_missing(self):
+        items = [mock_item("a", [7]), mock_item("b", [7, 8]), mock_item("c", [])]
+        plan = RestorePlanner(items).plan()
+        self.assertEqual([volume for volume, _ in plan.reads], [7])
+        self.assertEqual(plan.missing, [items[2]])
+
+    def test_optimal(self):
+        for seed in range(20):
+            items = random_items(12, 8, 2, seed)
+            plan = RestorePlanner(items).plan()
+            self.assertCovers(plan, items)
+            self.assertEqual(plan.swaps, minimum_cover(items))
+
+    def test_dominated(self):
+        masks = {"a": 0b011, "b": 0b111, "c": 0b111, "d": 0b100}
+        costs = {"a": 1, "b": 1, "c": 1, "d": 0.5}
+        self.assertEqual(RestorePlanner.prune_dominated(list(masks), masks, costs),
+                         ["b", "d"])
+
+    def test_budget(self):
+        items = random_items(60, 16, 2, 1)
+        planner = RestorePlanner(items, node_budget=1)
+        plan = planner.plan()
+        self.assertCovers(plan, items)
+        self.assertLessEqual(plan.swaps, 16)
+
+    def test_timing(self):
+        for count in (200, 500, 1000):
+            items = random_items(count, 20, 4, count)
+            start = time.monotonic()
+            plan = RestorePlanner(items).plan()
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertCovers(plan, items)
+
+    def test_thousands_of_volumes(self):
+        for volumes in (1000, 5000):
+            items = random_items(20000, volumes, 3, volumes)
+            start = time.monotonic()
+            plan = RestorePlanner(items).plan()
+            self.assertLess(time.monotonic() - start, 2)
+            self.assertCovers(plan, items)
+            self.assertLess(plan.swaps, volumes)
+
+    def test_free_volumes(self):
+        items = [mock_item("a", [1, 2]), mock_item("b", [2, 3]),
+                 mock_item("c", [3, 4])]
+        costs = {1: 1, 2: 0, 3: 1, 4: 0}
+        for exact_limit in (0, 10):
+            plan = RestorePlanner(items, volume_cost=costs.get,
+                                  exact_limit=exact_limit).plan()
+            self.assertCovers(plan, items)
+            self.assertEqual([volume for volume, _ in plan.reads], [2, 4])
+
+    def test_under_replicated(self):
+        items = [mock_item("a", [1], value=10), mock_item("b", [1], value=1),
+                 mock_item("c", [1, 2], value=5)]
+        result = [(item.relative_path, copies, required) 
+                  for item, copies, required in under_replicated(items, 4)]
+        self.assertEqual(result, [("a", 1, 4)])
+
+
+if __name__ == "__main__":
+    unittest.main()
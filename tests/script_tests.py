@@ -0,0 +1,60 @@
+import os
+import sys
+import subprocess
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from helpers import CollectorTreeTestCase, ROOTDIR
+from collector.snapshot import Snapshot
+
+SCRIPT = Path(ROOTDIR, "scripts", "jmcollector")
+
+
+class ScriptTestCase(CollectorTreeTestCase):
+    files = {"Docs/a.txt": "hello", "Docs/b.txt": "world"}
+
+    def run_script(self, *args):
+        return subprocess.run([sys.executable, str(SCRIPT), "--master",
+                               str(self.root), "--no-daemon"] + list(args),
+                              capture_output=True, text=True, timeout=60)
+
+    def test_verify_stored_snapshot(self):
+        result = self.run_script("verify")
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("no catalogue snapshot", result.stderr)
+        self.assertEqual(self.run_script("update").returncode, 0)
+        self.assertEqual(self.run_script("verify").returncode, 0)
+        os.unlink(Path(self.root, "Docs", "a.txt"))
+        result = self.run_script("verify")
+        self.assertEqual(result.returncode, 1)
+        self.assertEqual(result.stdout, "missing: Docs/a.txt\n")
+        self.assertIn("run update", result.stderr)
+
+    def test_list_stale_snapshot(self):
+        result = self.run_script("list")
+        self.assertEqual(result.stdout, "Docs/a.txt\nDocs/b.txt\n")
+        snapshot_mtime = Snapshot.get_path(self.root).stat().st_mtime_ns
+        self.write_files({"Docs/c.txt": "new"})
+        result = self.run_script("list")
+        # The stale snapshot is listed, it isn't rebuilt behind the scenes
+        self.assertEqual(result.stdout, "Docs/a.txt\nDocs/b.txt\n")
+        self.assertIn("run update", result.stderr)
+        self.assertEqual(Snapshot.get_path(self.root).stat().st_mtime_ns,
+                         snapshot_mtime)
+        self.run_script("update")
+        result = self.run_script("list")
+        self.assertEqual(result.stdout, "Docs/a.txt\nDocs/b.txt\nDocs/c.txt\n")
+        self.assertEqual(result.stderr, "")
+
+    def test_distributed_update(self):
+        result = self.run_script("--distributed-workers", "2", "update")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(self.run_script("list").stdout,
+                         "Docs/a.txt\nDocs/b.txt\n")
+        result = self.run_script("--distributed-address", "7077", "update")
+        self.assertIn("HOST:PORT", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
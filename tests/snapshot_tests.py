@@ -0,0 +1,76 @@
+import os
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from helpers import CollectorTreeTestCase, DOCS, ALBUMS, write
+from collector.snapshot import Snapshot, MAGIC, VERSION, RELATIVE_PATH, FILES
+
+
+class SnapshotTestCase(CollectorTreeTestCase):
+    collections = {"docs": DOCS, "albums": ALBUMS}
+    files = {"Docs/a.txt": "hello", "Docs/b.txt": "world",
+             "Albums/record1/track1.mp3": "one",
+             "Albums/record1/track2.mp3": "two"}
+
+    def build(self):
+        return Snapshot.from_collector(super().build())
+
+    def test_from_collector(self):
+        snapshot = self.build()
+        self.assertEqual(sorted(snapshot.collections), ["Albums", "Docs"])
+        items = [(name, record[RELATIVE_PATH]) for name, record in snapshot.iter_items()]
+        self.assertEqual(sorted(items), [("Albums", "record1"), ("Docs", "a.txt"),
+                                         ("Docs", "b.txt")])
+        files = sorted(path for path, _, _ in snapshot.iter_files())
+        self.assertEqual(files, ["Albums/record1/track1.mp3",
+                                 "Albums/record1/track2.mp3",
+                                 "Docs/a.txt", "Docs/b.txt"])
+
+    def test_round_trip(self):
+        snapshot = self.build()
+        snapshot.save(self.root)
+        loaded = Snapshot.load(self.root)
+        self.assertEqual(loaded.collections, snapshot.collections)
+        self.assertEqual(loaded.stamps, snapshot.stamps)
+        record = dict(loaded.iter_items("Albums"))["Albums"]
+        self.assertEqual([f[0] for f in record[FILES]], ["track1.mp3", "track2.mp3"])
+
+    def test_version(self):
+        path = Snapshot.get_path(self.root)
+        self.assertIsNone(Snapshot.load(self.root))
+        path.parent.mkdir(parents=True)
+        path.write_bytes(MAGIC + bytes([VERSION - 1]) + b"old data")
+        with self.assertRaisesRegex(ValueError, "not a valid catalogue snapshot"):
+            Snapshot.read(path)
+        self.assertIsNone(Snapshot.load(self.root))
+        path.write_bytes(b"garbage")
+        self.assertIsNone(Snapshot.load(self.root))
+
+    def test_verify(self):
+        snapshot = self.build()
+        self.assertEqual(list(snapshot.verify(self.root)), [])
+        write(Path(self.root, "Docs", "a.txt"), "hello again")
+        os.unlink(Path(self.root, "Albums", "record1", "track2.mp3"))
+        self.assertEqual(list(snapshot.verify(self.root)),
+                         [("Docs/a.txt", "size"),
+                          ("Albums/record1/track2.mp3", "missing")])
+        self.assertEqual(list(snapshot.verify(self.root, "Albums")),
+                         [("Albums/record1/track2.mp3", "missing")])
+
+    def test_stale(self):
+        snapshot = self.build()
+        self.assertFalse(snapshot.is_stale(self.root))
+        docs = Path(self.root, "Docs")
+        write(Path(docs, "c.txt"), "new")
+        os.utime(docs, ns=(0, 1))
+        self.assertTrue(snapshot.is_stale(self.root))
+        snapshot = self.build()
+        self.assertFalse(snapshot.is_stale(self.root))
+        os.utime(Path(self.root, "jmcollector.yml"), ns=(0, 1))
+        self.assertTrue(snapshot.is_stale(self.root))
+
+
+if __name__ == "__main__":
+    unittest.main()
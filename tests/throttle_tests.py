@@ -0,0 +1,145 @@
+import sys
+import time
+import hashlib
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from helpers import CollectorTreeTestCase, DOCS
+from collector.collector import Collector
+from collector.constructor import DistributedCollectionConstructor
+from collector.registry import CollectionSettings
+from collector.throttle import IOGovernor
+
+
+class IOGovernorTestCase(unittest.TestCase):
+    def test_rate(self):
+        governor = IOGovernor(rate=1000, burst=100)
+        with mock.patch("time.sleep") as sleep:
+            governor.tokens.value = 100
+            governor.consume(100, 0)
+            sleep.assert_not_called()
+            governor.consume(300, 0)
+        (delay,), _ = sleep.call_args
+        self.assertAlmostEqual(delay, 0.3, places=2)
+
+    def test_latency_without_rate(self):
+        governor = IOGovernor(latency_target=0.01)
+        with mock.patch("time.sleep") as sleep:
+            governor.consume(1000, 0.001)
+            sleep.assert_not_called()
+            governor.consume(1000, 0.05)
+        self.assertEqual(governor.factor.value, 0.5)
+        # The slow read is made to take twice as long
+        sleep.assert_called_once_with(0.05)
+
+    def test_latency_with_rate(self):
+        governor = IOGovernor(rate=1000, latency_target=0.01)
+        governor.consume(0, 0.05)
+        self.assertEqual(governor.factor.value, 0.5)
+        with mock.patch("time.sleep") as sleep:
+            governor.tokens.value = 0
+            governor.last.value = time.monotonic()
+            governor.consume(100, 0)
+        (delay,), _ = sleep.call_args
+        # 100 bytes at about half of 1000 bytes/s, a fast read recovers 5%
+        self.assertAlmostEqual(delay, 100 / 525, places=2)
+
+
+class ControlFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.control_path = Path(self.tmpdir.name, "limits.yml")
+        self.governor = IOGovernor(rate=100, control_path=self.control_path)
+
+    def write(self, content):
+        self.control_path.write_text(content)
+        self.governor.control_mtime = None
+
+    def test_limits(self):
+        self.write("rate: 500\nburst: 10\nlatency_target: 0.5\n")
+        self.governor.read_control()
+        self.assertEqual(self.governor.rate.value, 500)
+        self.assertEqual(self.governor.burst.value, 10)
+        self.assertEqual(self.governor.latency_target.value, 0.5)
+
+    def test_partial_limits(self):
+        governor = IOGovernor(rate=1e6, burst=5e5, latency_target=0.05,
+                              control_path=self.control_path)
+        self.control_path.write_text("rate: 2000000\n")
+        governor.read_control()
+        self.assertEqual(governor.rate.value, 2e6)
+        self.assertEqual(governor.burst.value, 5e5)
+        self.assertEqual(governor.latency_target.value, 0.05)
+        self.write("latency_target: null\n")
+        self.governor.read_control()
+        self.assertEqual(self.governor.rate.value, 100)
+        self.assertEqual(self.governor.latency_target.value, 0)
+
+    def test_unknown_limits(self):
+        self.write("rate: 7\nspeed: fast\n")
+        with self.assertLogs("collector.command", "ERROR") as logs:
+            self.governor.read_control()
+        self.assertIn("['speed']", logs.output[0])
+        self.assertEqual(self.governor.rate.value, 7)
+
+    def test_bad_file(self):
+        for content in ("rate: [1\n", "- 1\n- 2\n"):
+            self.write(content)
+            with self.assertLogs("collector.command", "ERROR"):
+                self.governor.read_control()
+            self.assertEqual(self.governor.rate.value, 100)
+
+    def test_watcher_survives(self):
+        with mock.patch("collector.throttle.CONTROL_POLL_INTERVAL", 0.01):
+            self.governor.start()
+            self.addCleanup(self.governor.stop)
+            with self.assertLogs("collector.command", "ERROR"):
+                self.write("rate: 5\nburst: [\n")
+                time.sleep(0.1)
+            self.write("rate: 5\nburst: 10\n")
+            time.sleep(0.1)
+        self.assertTrue(self.governor.watcher.is_alive())
+        self.assertEqual(self.governor.burst.value, 10)
+
+
+class ThrottleSettingsTestCase(CollectorTreeTestCase):
+    collections = {"docs": dict(DOCS, throttle={"rate": 1000000000,
+                                                "latency_target": 10})}
+    files = {"Docs/a.txt": "hello"}
+
+    def test_settings(self):
+        settings = CollectionSettings("docs", {"throttle": {"rate": 10, "nice": 5}})
+        governor = settings.get_governor()
+        self.assertEqual(governor.rate.value, 10)
+        self.assertEqual(governor.nice, 5)
+        self.assertIsNone(CollectionSettings("docs").get_governor())
+        with self.assertRaisesRegex(ValueError, "speed"):
+            CollectionSettings("docs", {"throttle": {"speed": 10}})
+
+    def test_build(self):
+        rates = []
+        make_pool = IOGovernor.make_pool
+
+        def recording_make_pool(governor, processes=None):
+            rates.append(governor.rate.value)
+            return make_pool(governor, processes)
+
+        with mock.patch.object(IOGovernor, "make_pool", recording_make_pool):
+            docs, = self.build().collections
+        self.assertEqual(rates, [1000000000])
+        self.assertEqual(docs.items[0].file.sha1, hashlib.sha1(b"hello").hexdigest())
+
+    def test_distributed(self):
+        collector = Collector(self.root)
+        collection_class = collector.get_collection_class("docs")
+        with self.assertRaisesRegex(ValueError, "can't be throttled"):
+            DistributedCollectionConstructor(collector, collection_class,
+                                             governor=IOGovernor(rate=10))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import sys
+import hashlib
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from helpers import mock_item, write
+from collector.command import TAG, INFO_PATH, load
+from collector.file import File
+from collector.volume import Volume
+from collector.writer import (VolumeWriter, VerificationError, PROGRESS_PATH,
+                              pipelined_copy, fast_copy)
+
+
+class CopyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.source = Path(self.tmpdir.name, "source")
+        self.data = os.urandom(100 * 1024 + 7)
+        self.source.write_bytes(self.data)
+
+    def test_pipelined_copy(self):
+        target = Path(self.tmpdir.name, "target")
+        sha1 = pipelined_copy(self.source, target, buffer_size=4096)
+        self.assertEqual(sha1, hashlib.sha1(self.data).hexdigest())
+        self.assertEqual(target.read_bytes(), self.data)
+        blake2b = pipelined_copy(self.source, target, algorithm="blake2b")
+        self.assertEqual(blake2b, hashlib.blake2b(self.data).hexdigest())
+
+    def test_fast_copy(self):
+        target = Path(self.tmpdir.name, "target")
+        self.assertEqual(fast_copy(self.source, target), len(self.data))
+        self.assertEqual(target.read_bytes(), self.data)
+
+    def test_write_error_stops_reader(self):
+        threads = threading.active_count()
+        # A directory can't be opened for writing
+        with self.assertRaises(IsADirectoryError):
+            pipelined_copy(self.source, self.tmpdir.name, buffer_size=1024)
+        self.assertEqual(threading.active_count(), threads)
+
+
+class VolumeWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.master = Path(self.tmpdir.name, "master")
+        self.target = Path(self.tmpdir.name, "target")
+        contents = {"Docs/a.txt": b"hello", "Docs/b.txt": b"world",
+                    "Albums/r1/t1": b"one"}
+        self.files = []
+        for relative_path, data in contents.items():
+            path = Path(self.master, relative_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            self.files.append(File(path, len(data),
+                                   sha1=hashlib.sha1(data).hexdigest()))
+        self.volume = Volume(7, [mock_item(*self.files[:2]),
+                                 mock_item(self.files[2])])
+
+    def test_write(self):
+        writer = VolumeWriter(self.volume, self.master, self.target)
+        self.assertEqual(writer.write(), 3)
+        self.assertEqual(Path(self.target, "Docs/a.txt").read_bytes(), b"hello")
+        self.assertEqual(Path(self.target, "Albums/r1/t1").read_bytes(), b"one")
+        self.assertFalse(Path(self.target, PROGRESS_PATH).exists())
+        self.assertEqual(Path(self.target, TAG).read_text(), "7\n")
+        with open(Path(self.target, INFO_PATH), encoding="utf-8") as f:
+            manifest = load(f)
+        self.assertEqual(manifest["volume"], 7)
+        self.assertEqual([entry["path"] for entry in manifest["files"]],
+                         ["Albums/r1/t1", "Docs/a.txt", "Docs/b.txt"])
+        self.assertEqual(manifest["files"][1]["sha1"], self.files[0].sha1)
+        self.assertEqual(manifest["files"][1]["size"], 5)
+
+    def test_resume(self):
+        progress = Path(self.target, PROGRESS_PATH)
+        progress.parent.mkdir(parents=True)
+        progress.write_text("Docs/a.txt\nDocs/b.txt\nAlbums/r1/t1\n")
+        # a.txt was written, b.txt was lost and t1 was cut
+        write(Path(self.target, "Docs/a.txt"), b"HELLO")
+        write(Path(self.target, "Albums/r1/t1"), b"o")
+        writer = VolumeWriter(self.volume, self.master, self.target, verify=False)
+        with self.assertLogs("collector.command", "WARNING"):
+            self.assertEqual(writer.write(), 2)
+        # Files already written aren't copied again
+        self.assertEqual(Path(self.target, "Docs/a.txt").read_bytes(), b"HELLO")
+        self.assertEqual(Path(self.target, "Docs/b.txt").read_bytes(), b"world")
+        self.assertEqual(Path(self.target, "Albums/r1/t1").read_bytes(), b"one")
+        self.assertTrue(Path(self.target, TAG).exists())
+
+    def test_verification_error(self):
+        self.files[1].set_sha1(hashlib.sha1(b"other").hexdigest())
+        writer = VolumeWriter(self.volume, self.master, self.target)
+        with self.assertRaises(VerificationError):
+            writer.write()
+        self.assertEqual(Path(self.target, PROGRESS_PATH).read_text(),
+                         "Docs/a.txt\n")
+        self.assertFalse(Path(self.target, "Docs/b.txt").exists())
+        self.assertFalse(Path(self.target, "Docs/b.txt.part").exists())
+        self.assertFalse(Path(self.target, TAG).exists())
+
+    def use_blake2b(self, file, data):
+        "Makes file part of a collection hashed only with blake2b"
+        file.item = mock.Mock(**{"collection.digest_algorithms": ("blake2b",)})
+        file.sha1 = None
+        file.digests = {"blake2b": hashlib.blake2b(data).hexdigest()}
+
+    def test_verify_other_algorithm(self):
+        self.use_blake2b(self.files[0], b"hello")
+        self.use_blake2b(self.files[1], b"other")
+        writer = VolumeWriter(self.volume, self.master, self.target)
+        with self.assertRaisesRegex(VerificationError, "Docs/b.txt blake2b"):
+            writer.write()
+        self.assertEqual(Path(self.target, "Docs/a.txt").read_bytes(), b"hello")
+        self.assertFalse(Path(self.target, "Docs/b.txt").exists())
+
+    def test_verify_without_digest(self):
+        self.files[0].sha1 = None
+        self.files[0].digests = {}
+        writer = VolumeWriter(self.volume, self.master, self.target)
+        with self.assertRaisesRegex(VerificationError, "no sha1 digest"):
+            writer.write()
+        self.assertFalse(Path(self.target, "Docs/a.txt").exists())
+        # Nothing to verify against, it's copied as it is
+        writer = VolumeWriter(self.volume, self.master, self.target, verify=False)
+        self.assertEqual(writer.write(), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()